@@ -30,12 +30,24 @@ Auto GPU:
 - --device cuda: tenta cuda, se não houver, cai para cpu sem quebrar
 - --device cpu: força cpu
 
+Paralelismo:
+- --workers N (default 1): distribui os arquivos entre N processos, cada um com seu modelo
+  pré-carregado e cpu_threads = núcleos / N. O processo pai agrega os logs e é o único que
+  escreve no CacheDB.
+
+- --pipeline true (default, com workers=1): uma thread por etapa (ASR -> texto -> diarização/papéis)
+  com filas limitadas; a diarização do arquivo N sobrepõe o ASR do arquivo N+1.
+- --diar_parallel true (default): com HF_TOKEN, a diarização de um arquivo roda em paralelo ao
+  ASR do mesmo arquivo; a junção acontece só na atribuição de speakers.
+
 Pyannote continua opcional (HF_TOKEN) e nunca pode travar o pipeline.
 """
 
 from __future__ import annotations
 
 import argparse
+import bisect
+import contextlib
 import datetime as _dt
 import hashlib
 import json
@@ -43,49 +55,142 @@ import os
 import re
 import shutil
 import sqlite3
+import sys
 import time
 import threading
 import warnings
-from dataclasses import dataclass
+import zlib
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+_T_IMPORT0 = time.perf_counter()  # início da importação (breakdown de startup no main)
 
 import numpy as np
 
 warnings.filterwarnings("ignore", message=r".*torchcodec is not installed correctly.*")
 
 # ------------------------------
-# Pontuação (opcional)
+# Dependências pesadas opcionais: carregadas na primeira necessidade real
+# (--help, execuções 100% cache e arquivos sem segmentos não pagam o custo)
 # ------------------------------
-try:
-    from deepmultilingualpunctuation import PunctuationModel  # type: ignore
-    _PUNCT_MODEL = PunctuationModel()
-except Exception:
-    _PUNCT_MODEL = None
+_PUNCT_MODEL: Any = None
+_PUNCT_LOADED = False
+_PUNCT_LOCK = threading.Lock()
+
+
+def _get_punct_model() -> Any:
+    """PunctuationModel (opcional) instanciado uma vez por processo; None se indisponível."""
+    global _PUNCT_MODEL, _PUNCT_LOADED
+    if _PUNCT_LOADED:
+        return _PUNCT_MODEL
+    with _PUNCT_LOCK:
+        if not _PUNCT_LOADED:
+            try:
+                from deepmultilingualpunctuation import PunctuationModel  # type: ignore
+                _PUNCT_MODEL = PunctuationModel()
+            except Exception:
+                _PUNCT_MODEL = None
+            _PUNCT_LOADED = True
+    return _PUNCT_MODEL
+
 
-# ------------------------------
 # Fuzzy (opcional) — preferir rapidfuzz
-# ------------------------------
-try:
-    from rapidfuzz import fuzz as _rfuzz  # type: ignore
-except Exception:
-    _rfuzz = None
+_FUZZ_BACKENDS: Optional[Tuple[Any, Any]] = None
+
+
+def _fuzz_backends() -> Tuple[Any, Any]:
+    """(rapidfuzz.fuzz, fuzzywuzzy.fuzz), importados na primeira chamada; None para o que faltar."""
+    global _FUZZ_BACKENDS
+    if _FUZZ_BACKENDS is None:
+        try:
+            from rapidfuzz import fuzz as rfuzz  # type: ignore
+        except Exception:
+            rfuzz = None
+        try:
+            from fuzzywuzzy import fuzz as fwfuzz  # type: ignore
+        except Exception:
+            fwfuzz = None
+        _FUZZ_BACKENDS = (rfuzz, fwfuzz)
+    return _FUZZ_BACKENDS
+
+
+def _module_available(name: str) -> bool:
+    """Checa se o módulo existe sem importá-lo."""
+    try:
+        import importlib.util
+
+        return importlib.util.find_spec(name) is not None
+    except Exception:
+        return False
 
-try:
-    from fuzzywuzzy import fuzz  # type: ignore
-except Exception:
-    fuzz = None
+
+def _fuzzy_backend_name() -> str:
+    if _module_available("rapidfuzz"):
+        return "rapidfuzz"
+    if _module_available("fuzzywuzzy"):
+        return "fuzzywuzzy"
+    return "desabilitado"
+
+
+def _dict_fuzzy_backend() -> str:
+    """
+    Backend do passe fuzzy do dicionário. Como no original, só fuzzywuzzy (fuzz.ratio);
+    sem ele não há passe fuzzy. Com python-Levenshtein por trás, o ratio é o mesmo do
+    rapidfuzz e o passe pode usar rapidfuzz.process; com difflib os scores diferem.
+    """
+    if not _module_available("fuzzywuzzy"):
+        return "desabilitado"
+    return "fuzzywuzzy+levenshtein" if _module_available("Levenshtein") else "fuzzywuzzy"
 
 # ------------------------------
 # Constantes
 # ------------------------------
 _AUDIO_EXTS = {".wav", ".mp3", ".flac", ".m4a", ".ogg", ".aac", ".wma", ".mp4"}
 DEFAULT_LANG = "pt"
+ASR_SAMPLE_RATE = 16000  # taxa esperada pelo faster-whisper
+# taxa nominal (16 kHz mono, 16 bits) para estimar a duração pelo tamanho quando nenhum arquivo tem cabeçalho legível
+EST_BYTES_PER_S = 32000.0
+# ASR em chunks (--asr_chunk_workers): cortes em silêncios do VAD, chunks de 2–5 min
+ASR_CHUNK_MIN_S = 120.0
+ASR_CHUNK_MAX_S = 300.0
+ASR_CHUNK_OVERLAP_S = 2.0      # só em cortes forçados (sem silêncio na janela)
+ASR_CHUNK_MIN_SILENCE_MS = 300
+# ASR em lote entre arquivos (--asr_batch_size): fala recortada pelo VAD em clips de até 30 s
+ASR_BATCH_CLIP_S = 30.0         # janela do Whisper; cada clip é de um único arquivo
+ASR_BATCH_MAX_FILE_S = 300.0    # arquivos mais longos seguem o caminho normal
+ASR_BATCH_FILES = 8             # arquivos curtos decodificados e transcritos juntos
+# Perfis de ASR (--profile): do mais preciso ao mais rápido. Em CPU, beam 3 já é bem mais rápido que 5.
+ASR_PROFILES: Dict[str, Dict[str, Any]] = {
+    "accurate": {"model": "large-v3", "beam_size": 5},
+    "balanced": {"model": "medium", "beam_size": 3},
+    "fast": {"model": "small", "beam_size": 1, "compute_type_cuda": "int8_float16"},
+}
+ASR_PROFILE_ORDER = ("accurate", "balanced", "fast")
+# RTF esperado só do ASR (tempo / duração do áudio) por perfil; base do plano com --deadline
+ASR_PROFILE_RTF: Dict[str, Dict[str, float]] = {
+    "cpu": {"accurate": 1.0, "balanced": 0.5, "fast": 0.15},
+    "cuda": {"accurate": 0.08, "balanced": 0.05, "fast": 0.03},
+}
+# Segunda passada (--escalate): segmentos de baixa confiança refeitos com o modelo maior
+ESCALATE_MODEL = "large-v3"
+ESCALATE_BEAM = 5
+ESCALATE_LOGPROB = -1.0         # avg_logprob abaixo disso = baixa confiança
+ESCALATE_NO_SPEECH = 0.6        # no_speech_prob acima disso = provável silêncio/alucinação
+ESCALATE_PAD_S = 0.5            # margem de áudio em volta do trecho refeito
+AUDIO_BLOCK_FRAMES = 1 << 16  # leitura do áudio em blocos (limita o pico de memória em gravações longas)
 
 CACHE_DIR_NAME = "arquivos_historico_audio"
 CACHE_DB_NAME = "cache.db"
+CACHE_COMMIT_EVERY = 200     # escritas por transação nos laços rápidos (consulta inicial, reprocessamento)
+CACHE_LOOKUP_CHUNK = 500     # arquivos por consulta em lote (get_many) no início da execução
+CACHE_ZLIB_LEVEL = 6
+# PRAGMA user_version do cache.db: 0 = JSON em colunas TEXT (formato original);
+# 1 = meta_json/json_content/payload_json declarados BLOB e gravados como JSON zlib
+CACHE_SCHEMA_VERSION = 1
 
 # Diarização (qualidade mínima)
+PYANNOTE_MODEL_ID = "pyannote/speaker-diarization-3.1"
 DIAR_COLLAPSE_MAX_SHARE = 0.90  # se um speaker tiver > 90% do tempo, consideramos colapsado
 DIAR_MIN_COVERAGE = 0.25        # cobertura mínima de atribuição (por tempo) para aceitar diarização
 
@@ -99,6 +204,9 @@ SPLIT_MIN_SENT_CHARS = 3
 SPLIT_MAX_SENTENCES_PER_SEG = 6  # evita explosão em casos ruins
 SPLIT_ENABLE = True
 
+# Dicionário: score mínimo (fuzz.ratio) do passe fuzzy
+DICT_FUZZY_THRESHOLD = 80
+
 # Fallback textual
 FUZZY_THRESHOLD = 86
 FUZZY_WEIGHT_FACTOR = 0.70
@@ -157,6 +265,45 @@ def _format_elapsed(seconds: float) -> str:
     return f"{m}m{s:04.1f}s"
 
 
+def _peak_rss_mb() -> Optional[float]:
+    """Pico de memória residente do processo (MB). Linux/macOS via resource; Windows via psapi."""
+    try:
+        import resource
+        peak = float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        if sys.platform == "darwin":
+            peak /= 1024.0  # bytes no macOS, KiB no Linux
+        return round(peak / 1024.0, 1)
+    except Exception:
+        pass
+
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class _PMC(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        pmc = _PMC()
+        pmc.cb = ctypes.sizeof(_PMC)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()  # type: ignore[attr-defined]
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(pmc), pmc.cb):  # type: ignore[attr-defined]
+            return round(pmc.PeakWorkingSetSize / (1024.0 * 1024.0), 1)
+    except Exception:
+        pass
+    return None
+
+
 def _try_get_wav_duration_seconds(path: Path) -> Optional[float]:
     try:
         import wave
@@ -170,26 +317,58 @@ def _try_get_wav_duration_seconds(path: Path) -> Optional[float]:
     return None
 
 
-def _resolve_device(device_arg: str) -> str:
-    d = (device_arg or "").strip().lower()
-    if d in {"", "auto"}:
-        try:
-            import torch  # type: ignore
-            return "cuda" if torch.cuda.is_available() else "cpu"
-        except Exception:
-            return "cpu"
+def _probe_duration_seconds(path: Path) -> Optional[float]:
+    """Duração lida só do cabeçalho: wave (WAV PCM), soundfile (FLAC/OGG/...), PyAV (MP3/M4A/MP4/...)."""
+    dur = _try_get_wav_duration_seconds(path)
+    if dur is not None:
+        return dur
+    try:
+        import soundfile as sf  # type: ignore
+        info = sf.info(str(path))
+        if info.samplerate > 0 and info.frames > 0:
+            return info.frames / float(info.samplerate)
+    except Exception:
+        pass
+    try:
+        import av  # type: ignore
+        with av.open(str(path)) as container:
+            if container.duration:
+                return float(container.duration) / float(av.time_base)
+            for stream in container.streams.audio:
+                if stream.duration and stream.time_base:
+                    return float(stream.duration * stream.time_base)
+    except Exception:
+        pass
+    return None
 
-    if d == "cuda":
-        try:
-            import torch  # type: ignore
-            return "cuda" if torch.cuda.is_available() else "cpu"
-        except Exception:
-            return "cpu"
 
+def _cuda_available() -> bool:
+    # ctranslate2 (backend do faster-whisper) responde sem o custo de importar torch
+    try:
+        import ctranslate2  # type: ignore
+        return int(ctranslate2.get_cuda_device_count()) > 0
+    except Exception:
+        pass
+    try:
+        import torch  # type: ignore
+        return bool(torch.cuda.is_available())
+    except Exception:
+        return False
+
+
+def _resolve_device(device_arg: str) -> str:
+    d = (device_arg or "").strip().lower()
+    if d in {"", "auto", "cuda"}:
+        return "cuda" if _cuda_available() else "cpu"
     return "cpu"
 
 
-def _start_heartbeat(prefix: str, every_s: float = 15.0) -> Tuple[threading.Event, threading.Thread]:
+def _start_heartbeat(
+    prefix: str,
+    every_s: float = 15.0,
+    status: Optional[Callable[[], str]] = None,
+) -> Tuple[threading.Event, threading.Thread]:
+    """status: texto extra de progresso real (ex.: segmentos/segundos de áudio do ASR)."""
     stop_evt = threading.Event()
     t0 = time.time()
     last_print = {"t": t0}
@@ -199,7 +378,13 @@ def _start_heartbeat(prefix: str, every_s: float = 15.0) -> Tuple[threading.Even
             time.sleep(0.2)
             now = time.time()
             if now - last_print["t"] >= every_s:
-                print(f"  Progresso: {prefix} | tempo decorrido {_format_elapsed(now - t0)}")
+                extra = ""
+                if status is not None:
+                    try:
+                        extra = f" | {status()}"
+                    except Exception:
+                        extra = ""
+                print(f"  Progresso: {prefix}{extra} | tempo decorrido {_format_elapsed(now - t0)}")
                 last_print["t"] = now
 
     th = threading.Thread(target=_run, daemon=True)
@@ -227,11 +412,19 @@ def _ends_with_terminal_punct(s: str) -> bool:
 
 
 def _merge_asr_segments(segments: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
-    if not segments:
-        return [], {"merges": 0, "in": 0, "out": 0}
+    out, _starts, merges = _merge_asr_groups(segments)
+    return out, {"merges": merges, "in": len(segments), "out": len(out)}
+
 
+def _merge_asr_groups(segments: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[int], int]:
+    """
+    Merge guloso da esquerda para a direita. Devolve também o índice (em segments) em que cada
+    grupo começa: um grupo só depende dos segmentos a partir do seu início, então todos menos o
+    último estão fechados e o merge pode continuar do último (saída parcial incremental).
+    """
     merges = 0
     out: List[Dict[str, Any]] = []
+    starts: List[int] = []
 
     i = 0
     n = len(segments)
@@ -245,6 +438,7 @@ def _merge_asr_segments(segments: List[Dict[str, Any]]) -> Tuple[List[Dict[str,
         if not cur_text:
             i += 1
             continue
+        starts.append(i)
 
         while i + 1 < n:
             nxt = segments[i + 1]
@@ -286,7 +480,7 @@ def _merge_asr_segments(segments: List[Dict[str, Any]]) -> Tuple[List[Dict[str,
         out.append(cur)
         i += 1
 
-    return out, {"merges": merges, "in": len(segments), "out": len(out)}
+    return out, starts, merges
 
 
 # =============================================================================
@@ -392,40 +586,281 @@ def carregar_dicionario(dict_path: str) -> Dict[str, str]:
     return dicionario
 
 
-def aplicar_dicionario(texto: str, dicionario: Dict[str, str], threshold: int = 80) -> Tuple[str, int]:
-    texto_corrigido = texto
-    n_corrigidas = 0
-
-    texto_normalizado = re.sub(r"[^\w\sÀ-ÿ]", "", texto_corrigido)
+class DictionaryCorrector:
+    """
+    Corretor lexical montado uma vez a partir de carregar_dicionario.
+
+    Mantém exatamente a semântica de aplicar_dicionario:
+      - passe exato: entradas da maior para a menor, cada uma sobre o texto já corrigido
+        (entradas encadeiam, ex.: "a dente" -> "a gente" -> "a dente"); uma alternância
+        única descarta de uma vez os textos sem nenhuma entrada e, para os demais, só
+        roda o regex (pré-compilado) das chaves presentes no texto corrente;
+      - passe fuzzy: só com fuzzywuzzy, palavras do texto original, melhor chave por
+        fuzz.ratio (score inteiro, empate fica com a primeira chave do dicionário), agora
+        com índice por comprimento (ratio >= threshold exige comprimentos próximos) e memo
+        por palavra; rapidfuzz.process só acelera quando o fuzzywuzzy roda sobre
+        python-Levenshtein (mesmo ratio), nunca o substitui.
+    """
+
+    def __init__(self, dicionario: Dict[str, str], threshold: int = DICT_FUZZY_THRESHOLD):
+        self.dicionario = dict(dicionario)
+        self.threshold = int(threshold)
+
+        ordered = sorted(self.dicionario.items(), key=lambda x: len(x[0]), reverse=True)
+        self._exact: List[Tuple[str, "re.Pattern[str]", str]] = [
+            (orig.casefold(), re.compile(rf"\b{re.escape(orig)}\b", flags=re.IGNORECASE), corr)
+            for orig, corr in ordered
+        ]
+        self._exact_any = (
+            re.compile(r"\b(?:" + "|".join(re.escape(orig) for orig, _ in ordered) + r")\b", flags=re.IGNORECASE)
+            if ordered else None
+        )
 
-    for orig, corr in sorted(dicionario.items(), key=lambda x: len(x[0]), reverse=True):
-        padrao = re.compile(rf"\b{re.escape(orig)}\b", flags=re.IGNORECASE)
-        novo_texto, n = padrao.subn(corr, texto_corrigido)
-        if n > 0:
-            n_corrigidas += n
-        texto_corrigido = novo_texto
+        # índice por comprimento: {len: [(ordem, chave_lower, correção)]}
+        self._by_len: Dict[int, List[Tuple[int, str, str]]] = {}
+        for k, (orig, corr) in enumerate(self.dicionario.items()):
+            low = orig.lower()
+            self._by_len.setdefault(len(low), []).append((k, low, corr))
+        self._fuzzy_memo: Dict[str, Optional[str]] = {}
+        self._rapid: Optional[bool] = None
+        self._memo_lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return bool(self.dicionario)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        st = dict(self.__dict__)
+        st.pop("_memo_lock", None)
+        return st
+
+    def __setstate__(self, st: Dict[str, Any]) -> None:
+        self.__dict__.update(st)
+        self._memo_lock = threading.Lock()
+
+    def _candidates(self, palavra_low: str) -> List[Tuple[int, str, str]]:
+        # fuzz.ratio = round(200*LCS/(la+lb)) <= round(200*min/(la+lb)); margem de 0.5 pelo arredondamento
+        la = len(palavra_low)
+        out: List[Tuple[int, str, str]] = []
+        for lb, items in self._by_len.items():
+            if la + lb == 0 or 200.0 * min(la, lb) / (la + lb) < self.threshold - 0.5:
+                continue
+            out.extend(items)
+        out.sort(key=lambda c: c[0])
+        return out
 
-    if fuzz is not None:
-        palavras = re.findall(r"\b[\wÀ-ÿ']+\b", texto_normalizado)
-        for palavra in palavras:
-            melhor_match, melhor_score = None, 0
-            for orig, corr in dicionario.items():
-                score = fuzz.ratio(palavra.lower(), orig.lower())  # type: ignore[attr-defined]
-                if score > melhor_score and score >= threshold:
-                    melhor_match, melhor_score = corr, score
-            if melhor_match and melhor_match != palavra:
-                padrao = re.compile(rf"\b{re.escape(palavra)}\b", re.IGNORECASE)
-                novo_texto, n = padrao.subn(melhor_match, texto_corrigido)
+    def _best_fuzzy(self, palavra_low: str) -> Optional[str]:
+        memo = self._fuzzy_memo.get(palavra_low, "")
+        if memo != "":
+            return memo
+
+        cands = self._candidates(palavra_low)
+        best_corr: Optional[str] = None
+        best_score = 0
+        _rfuzz, fuzz = _fuzz_backends()
+        if self._rapid is None:
+            # fuzzywuzzy sobre difflib dá outros scores: aí o rapidfuzz não pode substituí-lo
+            matcher = getattr(fuzz, "SequenceMatcher", None)
+            self._rapid = _rfuzz is not None and "StringMatcher" in str(getattr(matcher, "__module__", ""))
+        if cands and fuzz is not None and self._rapid:
+            from rapidfuzz import process as _rprocess  # type: ignore
+
+            hits = _rprocess.extract(
+                palavra_low,
+                [c[1] for c in cands],
+                scorer=_rfuzz.ratio,
+                limit=None,
+                score_cutoff=self.threshold - 0.5,
+            )
+            best_pos = -1
+            for _, score, pos in hits:
+                sc = int(round(score))
+                if sc < self.threshold:
+                    continue
+                if sc > best_score or (sc == best_score and pos < best_pos):
+                    best_score, best_pos = sc, pos
+            if best_pos >= 0:
+                best_corr = cands[best_pos][2]
+        elif cands and fuzz is not None:
+            for _, low, corr in cands:
+                score = fuzz.ratio(palavra_low, low)  # type: ignore[attr-defined]
+                if score > best_score and score >= self.threshold:
+                    best_corr, best_score = corr, score
+
+        with self._memo_lock:
+            self._fuzzy_memo[palavra_low] = best_corr
+        return best_corr
+
+    @property
+    def fuzzy_enabled(self) -> bool:
+        return _fuzz_backends()[1] is not None
+
+    def apply(self, texto: str) -> Tuple[str, int]:
+        texto_corrigido = texto
+        n_corrigidas = 0
+
+        texto_normalizado = re.sub(r"[^\w\sÀ-ÿ]", "", texto_corrigido)
+
+        if self._exact_any is not None and self._exact_any.search(texto_corrigido):
+            texto_cf = texto_corrigido.casefold()
+            for orig_cf, padrao, corr in self._exact:
+                if orig_cf not in texto_cf:
+                    continue
+                novo_texto, n = padrao.subn(corr, texto_corrigido)
                 if n > 0:
                     n_corrigidas += n
+                    texto_cf = novo_texto.casefold()
                 texto_corrigido = novo_texto
 
-    return texto_corrigido, n_corrigidas
+        if self.fuzzy_enabled and self.dicionario:
+            palavras = re.findall(r"\b[\wÀ-ÿ']+\b", texto_normalizado)
+            for palavra in palavras:
+                melhor_match = self._best_fuzzy(palavra.lower())
+                if melhor_match and melhor_match != palavra:
+                    if palavra.casefold() not in texto_corrigido.casefold():
+                        continue
+                    padrao = re.compile(rf"\b{re.escape(palavra)}\b", re.IGNORECASE)
+                    novo_texto, n = padrao.subn(melhor_match, texto_corrigido)
+                    if n > 0:
+                        n_corrigidas += n
+                    texto_corrigido = novo_texto
+
+        return texto_corrigido, n_corrigidas
+
+
+def aplicar_dicionario(texto: str, dicionario: Any, threshold: int = DICT_FUZZY_THRESHOLD) -> Tuple[str, int]:
+    """Aceita o DictionaryCorrector já montado (caminho normal) ou o dict cru (monta um corretor na hora)."""
+    if not isinstance(dicionario, DictionaryCorrector):
+        dicionario = DictionaryCorrector(dicionario, threshold=threshold)
+    return dicionario.apply(texto)
+
+
+# =============================================================================
+# Pontuação (deepmultilingualpunctuation) em lote
+# =============================================================================
+PUNCT_CHUNK_WORDS = 230   # mesmos valores de PunctuationModel.predict
+PUNCT_CHUNK_OVERLAP = 5
+PUNCT_BATCH_SIZE = 16
+
+
+def _punct_chunks(words: List[str]) -> List[Tuple[List[str], int]]:
+    """Replica o fatiamento de PunctuationModel.predict: [(palavras do chunk, overlap a descartar)]."""
+    overlap = PUNCT_CHUNK_OVERLAP
+    if len(words) <= PUNCT_CHUNK_WORDS:
+        overlap = 0
+    step = PUNCT_CHUNK_WORDS - overlap
+    batches = [words[i:i + PUNCT_CHUNK_WORDS] for i in range(0, len(words), step)]
+    if len(batches[-1]) <= overlap:
+        batches.pop()
+
+    out: List[Tuple[List[str], int]] = []
+    for batch in batches:
+        if batch == batches[-1]:
+            overlap = 0
+        out.append((batch, overlap))
+    return out
+
+
+def _punct_tag_chunk(batch: List[str], overlap: int, text: str, result: List[Dict[str, Any]]) -> List[List[Any]]:
+    if len(text) != result[-1]["end"]:
+        raise ValueError("chunk size too large, text got clipped")
+    tagged: List[List[Any]] = []
+    char_index = 0
+    result_index = 0
+    score = None
+    for word in batch[:len(batch) - overlap]:
+        char_index += len(word) + 1
+        label: Any = 0
+        while result_index < len(result) and char_index > result[result_index]["end"]:
+            label = result[result_index]["entity"]
+            score = result[result_index]["score"]
+            result_index += 1
+        tagged.append([word, label, score])
+    return tagged
+
+
+def _restore_punctuation_batch(model: Any, texts: List[str], batch_size: int = PUNCT_BATCH_SIZE) -> List[str]:
+    """
+    Restaura a pontuação de vários segmentos com inferências em lote: todos os chunks de
+    todos os segmentos vão numa única chamada model.pipe(lista, batch_size=...), e cada
+    resultado volta ao seu segmento. Saída igual a restore_punctuation por segmento; segmento
+    que falharia lá (texto vazio, rótulo ausente, ...) fica com o texto original.
+    """
+    out = list(texts)
+    plan: List[Tuple[int, List[Tuple[List[str], int]]]] = []
+    chunk_texts: List[str] = []
+    for i, text in enumerate(texts):
+        try:
+            chunks = _punct_chunks(model.preprocess(text))
+        except Exception:
+            continue
+        plan.append((i, chunks))
+        chunk_texts.extend(" ".join(batch) for batch, _ in chunks)
+
+    if not chunk_texts:
+        return out
+
+    try:
+        results = model.pipe(chunk_texts, batch_size=max(1, int(batch_size)))
+        if len(chunk_texts) == 1 and results and isinstance(results[0], dict):
+            results = [results]
+    except Exception:
+        # pipeline sem suporte a lote: volta ao caminho por segmento
+        for i, _ in plan:
+            try:
+                out[i] = model.restore_punctuation(texts[i])
+            except Exception:
+                pass
+        return out
+
+    pos = 0
+    for i, chunks in plan:
+        seg_results = results[pos:pos + len(chunks)]
+        pos += len(chunks)
+        try:
+            tagged: List[List[Any]] = []
+            for (batch, overlap), res in zip(chunks, seg_results):
+                tagged.extend(_punct_tag_chunk(batch, overlap, " ".join(batch), res))
+            out[i] = model.prediction_to_text(tagged)
+        except Exception:
+            pass
+    return out
+
+
+# serializa o uso do modelo de pontuação entre a saída parcial (thread do ASR) e a etapa de texto
+_PUNCT_RUN_LOCK = threading.Lock()
+
+
+def _punctuate_segments(
+    model: Any,
+    segments: List[Dict[str, Any]],
+    batch_size: int = PUNCT_BATCH_SIZE,
+    memo: Optional[Dict[str, str]] = None,
+) -> int:
+    """Pontua seg["text"] no lugar; textos já no memo não voltam ao modelo. Devolve quantos foram."""
+    memo = {} if memo is None else memo
+    todo = list(dict.fromkeys(str(seg.get("text", "")) for seg in segments if str(seg.get("text", "")) not in memo))
+    if todo:
+        with _PUNCT_RUN_LOCK:
+            memo.update(zip(todo, _restore_punctuation_batch(model, todo, batch_size=batch_size)))
+    for seg in segments:
+        seg["text"] = memo[str(seg.get("text", ""))]
+    return len(todo)
 
 
 # =============================================================================
 # Cache
 # =============================================================================
+def _pack_json(obj: Any) -> bytes:
+    return zlib.compress(json.dumps(obj, ensure_ascii=False).encode("utf-8"), CACHE_ZLIB_LEVEL)
+
+
+def _unpack_json(value: Any) -> Any:
+    """BLOB zlib (schema 1) ou TEXT JSON (schema 0, antes da migração)."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return json.loads(zlib.decompress(bytes(value)).decode("utf-8"))
+    return json.loads(value)
+
+
 class CacheDB:
     def __init__(self, db_path: Path):
         self.db_path = db_path
@@ -433,12 +868,38 @@ class CacheDB:
         self.conn = sqlite3.connect(str(db_path), timeout=30.0)
         self.conn.execute("PRAGMA journal_mode=WAL;")
         self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.commit_every = 1
+        self._uncommitted = 0
         self._init_schema()
 
-    def _init_schema(self) -> None:
-        self.conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS transcriptions (
+    @contextlib.contextmanager
+    def batched(self, commit_every: int = CACHE_COMMIT_EVERY):
+        """
+        Agrupa as escritas em transações de commit_every. Só para laços rápidos: fora dele cada
+        escrita é confirmada na hora, para não segurar o lock de escrita durante um ASR longo.
+        """
+        prev = self.commit_every
+        self.commit_every = max(1, int(commit_every))
+        try:
+            yield self
+        finally:
+            self.commit_every = prev
+            self.flush()
+
+    def _wrote(self) -> None:
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._uncommitted:
+            self.conn.commit()
+            self._uncommitted = 0
+
+    # {name}: a migração cria a tabela nova com outro nome e renomeia no fim
+    _TABLES: Dict[str, str] = {
+        "transcriptions": """
+            CREATE TABLE IF NOT EXISTS {name} (
               cache_key TEXT PRIMARY KEY,
               audio_hash TEXT NOT NULL,
               params_hash TEXT NOT NULL,
@@ -446,24 +907,100 @@ class CacheDB:
               orig_ext TEXT NOT NULL,
               archived_path TEXT,
               created_at TEXT NOT NULL,
-              meta_json TEXT NOT NULL,
+              meta_json BLOB NOT NULL,
               txt_content TEXT NOT NULL,
-              json_content TEXT NOT NULL
+              json_content BLOB NOT NULL
+            );
+            """,
+        # cache por etapa (ASR bruto, turnos da diarização): chave = áudio + parâmetros da etapa
+        "stage_cache": """
+            CREATE TABLE IF NOT EXISTS {name} (
+              stage TEXT NOT NULL,
+              stage_key TEXT NOT NULL,
+              audio_hash TEXT NOT NULL,
+              created_at TEXT NOT NULL,
+              payload_json BLOB NOT NULL,
+              PRIMARY KEY (stage, stage_key)
+            );
+            """,
+    }
+    _BLOB_COLUMNS: Dict[str, Tuple[str, ...]] = {
+        "transcriptions": ("meta_json", "json_content"),
+        "stage_cache": ("payload_json",),
+    }
+
+    def _init_schema(self) -> None:
+        version = int(self.conn.execute("PRAGMA user_version;").fetchone()[0])
+        if version > CACHE_SCHEMA_VERSION:
+            print(f"Aviso: {self.db_path.name} tem schema {version}, mais novo que o deste script ({CACHE_SCHEMA_VERSION}).")
+        elif version < CACHE_SCHEMA_VERSION:
+            self._migrate_blob_columns()
+
+        for name, ddl in self._TABLES.items():
+            self.conn.execute(ddl.format(name=name))
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_transcriptions_audiohash ON transcriptions(audio_hash);")
+        # índice de impressões digitais: stat do arquivo -> sha256 (evita reler áudios inalterados)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS fingerprints (
+              path TEXT PRIMARY KEY,
+              size INTEGER NOT NULL,
+              mtime_ns INTEGER NOT NULL,
+              inode INTEGER NOT NULL,
+              dev INTEGER NOT NULL,
+              sha256 TEXT NOT NULL,
+              updated_at TEXT NOT NULL
             );
             """
         )
-        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_transcriptions_audiohash ON transcriptions(audio_hash);")
+        if version < CACHE_SCHEMA_VERSION:
+            self.conn.execute(f"PRAGMA user_version={CACHE_SCHEMA_VERSION};")
         self.conn.commit()
 
-    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
-        cur = self.conn.execute(
-            "SELECT cache_key, audio_hash, params_hash, orig_name, orig_ext, archived_path, created_at, meta_json, txt_content, json_content "
-            "FROM transcriptions WHERE cache_key=?",
-            (cache_key,),
-        )
-        row = cur.fetchone()
-        if not row:
-            return None
+    def _migrate_blob_columns(self) -> None:
+        """
+        Migração única 0 -> 1: recria transcriptions/stage_cache com as colunas JSON declaradas
+        BLOB e comprime as linhas ainda em TEXT, numa transação só. Bancos novos só criam as tabelas.
+        """
+        def _zpack(value: Any) -> Any:
+            if value is None or isinstance(value, bytes):
+                return value
+            return zlib.compress(str(value).encode("utf-8"), CACHE_ZLIB_LEVEL)
+
+        self.conn.create_function("_zpack", 1, _zpack, deterministic=True)
+        self.conn.execute("BEGIN")
+        try:
+            for name, blob_cols in self._BLOB_COLUMNS.items():
+                info = self.conn.execute(f"PRAGMA table_info({name});").fetchall()
+                if not info or all((r[2] or "").upper() == "BLOB" for r in info if r[1] in blob_cols):
+                    continue
+                cols = [r[1] for r in info]
+                exprs = [f"_zpack({c})" if c in blob_cols else c for c in cols]
+                tmp = f"{name}_v{CACHE_SCHEMA_VERSION}"
+                self.conn.execute(f"DROP TABLE IF EXISTS {tmp};")
+                self.conn.execute(self._TABLES[name].format(name=tmp))
+                self.conn.execute(f"INSERT INTO {tmp} ({', '.join(cols)}) SELECT {', '.join(exprs)} FROM {name};")
+                self.conn.execute(f"DROP TABLE {name};")
+                self.conn.execute(f"ALTER TABLE {tmp} RENAME TO {name};")
+                print(f"Cache: {name} migrado para colunas BLOB (schema {CACHE_SCHEMA_VERSION}).")
+            self.conn.execute(f"PRAGMA user_version={CACHE_SCHEMA_VERSION};")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    _SELECT_ROW = (
+        "SELECT cache_key, audio_hash, params_hash, orig_name, orig_ext, archived_path, created_at, meta_json, txt_content, json_content "
+        "FROM transcriptions "
+    )
+
+    @staticmethod
+    def _row_dict(row: Tuple[Any, ...]) -> Dict[str, Any]:
+        meta = _unpack_json(row[7])
+        json_obj = _unpack_json(row[9])
+        if "metadata" not in json_obj:
+            # formato compacto: metadata não é duplicado no json_content (é o meta sem archived_path)
+            json_obj = {"metadata": {k: v for k, v in meta.items() if k != "archived_path"}, **json_obj}
         return {
             "cache_key": row[0],
             "audio_hash": row[1],
@@ -472,11 +1009,26 @@ class CacheDB:
             "orig_ext": row[4],
             "archived_path": row[5],
             "created_at": row[6],
-            "meta": json.loads(row[7]),
+            "meta": meta,
             "txt": row[8],
-            "json": json.loads(row[9]),
+            "json": json_obj,
         }
 
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(self._SELECT_ROW + "WHERE cache_key=?", (cache_key,)).fetchone()
+        return self._row_dict(row) if row else None
+
+    def get_many(self, cache_keys: List[str], chunk_size: int = 500) -> Dict[str, Dict[str, Any]]:
+        """Uma consulta IN (...) por bloco de chaves (abaixo do limite de variáveis do SQLite)."""
+        keys = list(dict.fromkeys(k for k in cache_keys if k))
+        out: Dict[str, Dict[str, Any]] = {}
+        for i in range(0, len(keys), chunk_size):
+            part = keys[i:i + chunk_size]
+            marks = ",".join("?" * len(part))
+            for row in self.conn.execute(self._SELECT_ROW + f"WHERE cache_key IN ({marks})", part):
+                out[row[0]] = self._row_dict(row)
+        return out
+
     def upsert(
         self,
         cache_key: str,
@@ -508,20 +1060,200 @@ class CacheDB:
                 orig_ext,
                 archived_path,
                 _now_iso(),
-                json.dumps(meta, ensure_ascii=False),
+                _pack_json(meta),
                 txt_content,
-                json.dumps(json_obj, ensure_ascii=False),
+                _pack_json(self._compact_json(meta, json_obj)),
             ),
         )
-        self.conn.commit()
+        self._wrote()
+
+    @staticmethod
+    def _compact_json(meta: Dict[str, Any], json_obj: Dict[str, Any]) -> Dict[str, Any]:
+        """Tira o metadata do json_content quando ele é reconstruível a partir do meta_json."""
+        metadata = json_obj.get("metadata")
+        if metadata is not None and metadata == {k: v for k, v in meta.items() if k != "archived_path"}:
+            return {k: v for k, v in json_obj.items() if k != "metadata"}
+        return json_obj
+
+    def count_transcriptions(self, params_hash: str) -> int:
+        cur = self.conn.execute("SELECT COUNT(*) FROM transcriptions WHERE params_hash=?", (params_hash,))
+        return int(cur.fetchone()[0])
+
+    def iter_transcriptions(self, params_hash: str, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Percorre as entradas de um params_hash em páginas (por cache_key), sem TXT/JSON.
+        Cada página é lida inteira antes de ser entregue, então o chamador pode gravar
+        (upsert) na mesma conexão durante a iteração.
+        """
+        last = ""
+        while True:
+            rows = self.conn.execute(
+                "SELECT cache_key, audio_hash, orig_name, orig_ext, archived_path, meta_json "
+                "FROM transcriptions WHERE params_hash=? AND cache_key>? ORDER BY cache_key LIMIT ?",
+                (params_hash, last, int(page_size)),
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield {
+                    "cache_key": row[0],
+                    "audio_hash": row[1],
+                    "orig_name": row[2],
+                    "orig_ext": row[3],
+                    "archived_path": row[4],
+                    "meta": _unpack_json(row[5]),
+                }
+            last = rows[-1][0]
+
+    def get_fingerprint(self, path: str, st: os.stat_result) -> Optional[str]:
+        cur = self.conn.execute(
+            "SELECT sha256 FROM fingerprints WHERE path=? AND size=? AND mtime_ns=? AND inode=? AND dev=?",
+            (path, int(st.st_size), int(st.st_mtime_ns), int(st.st_ino), int(st.st_dev)),
+        )
+        row = cur.fetchone()
+        return row[0] if row else None
+
+    def put_fingerprint(self, path: str, st: os.stat_result, sha256: str) -> None:
+        self.conn.execute(
+            """
+            INSERT INTO fingerprints (path, size, mtime_ns, inode, dev, sha256, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+              size=excluded.size,
+              mtime_ns=excluded.mtime_ns,
+              inode=excluded.inode,
+              dev=excluded.dev,
+              sha256=excluded.sha256,
+              updated_at=excluded.updated_at;
+            """,
+            (path, int(st.st_size), int(st.st_mtime_ns), int(st.st_ino), int(st.st_dev), sha256, _now_iso()),
+        )
+        self._wrote()
+
+    def get_stage(self, stage: str, stage_key: str) -> Optional[Dict[str, Any]]:
+        cur = self.conn.execute(
+            "SELECT payload_json FROM stage_cache WHERE stage=? AND stage_key=?",
+            (stage, stage_key),
+        )
+        row = cur.fetchone()
+        if not row:
+            return None
+        return _unpack_json(row[0])
+
+    def put_stage(self, stage: str, stage_key: str, audio_hash: str, payload: Dict[str, Any]) -> None:
+        self.conn.execute(
+            """
+            INSERT INTO stage_cache (stage, stage_key, audio_hash, created_at, payload_json)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(stage, stage_key) DO UPDATE SET
+              created_at=excluded.created_at,
+              payload_json=excluded.payload_json;
+            """,
+            (stage, stage_key, audio_hash, _now_iso(), _pack_json(payload)),
+        )
+        self._wrote()
 
     def close(self) -> None:
+        try:
+            self.flush()
+        except Exception:
+            pass
         try:
             self.conn.close()
         except Exception:
             pass
 
 
+def _fingerprint_sha256(db: CacheDB, path: Path) -> Tuple[str, bool]:
+    """
+    sha256 do arquivo via índice de stat (caminho, tamanho, mtime_ns, inode, device).
+    Só relê o arquivo quando o stat mudou; devolve (sha256, veio_do_índice).
+    """
+    key = str(path.resolve())
+    st = path.stat()
+    try:
+        sha = db.get_fingerprint(key, st)
+    except Exception:
+        sha = None
+    if sha:
+        return sha, True
+
+    sha = _sha256_file(path)
+    try:
+        db.put_fingerprint(key, st, sha)
+    except Exception:
+        pass
+    return sha, False
+
+
+# =============================================================================
+# Áudio decodificado uma única vez (compartilhado por ASR, diarização e duração)
+# =============================================================================
+@dataclass
+class DecodedAudio:
+    samples: Any          # np.ndarray float32 mono
+    sample_rate: int
+    duration_s: float
+    sha256: str = ""      # preenchido quando o hash é calculado na mesma leitura
+    decoder: str = ""
+
+
+def _decode_audio(audio_path: Path, errors: List[Dict[str, str]], want_hash: bool = False) -> Optional[DecodedAudio]:
+    """
+    Lê o arquivo uma vez via mmap: o SHA256 (quando pedido) e a decodificação PyAV (a mesma
+    do faster-whisper, 16 kHz mono) usam o mesmo mapeamento, sem nova passada em disco.
+    Sem PyAV, cai para soundfile/wave em taxa nativa (serve para diarização e duração).
+    """
+    import mmap
+
+    sha = ""
+    samples = None
+    decoder = ""
+    try:
+        with open(audio_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size <= 0:
+                raise RuntimeError("arquivo vazio")
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if want_hash:
+                    sha = hashlib.sha256(mm).hexdigest()
+                try:
+                    from faster_whisper.audio import decode_audio  # type: ignore
+
+                    mm.seek(0)
+                    samples = decode_audio(mm, sampling_rate=ASR_SAMPLE_RATE)
+                    decoder = "pyav"
+                except Exception:
+                    samples = None
+    except Exception as e:
+        errors.append({"stage": "audio_read", "error": f"{type(e).__name__}: {e}"})
+        return None
+
+    if samples is not None:
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        return DecodedAudio(
+            samples=samples,
+            sample_rate=ASR_SAMPLE_RATE,
+            duration_s=float(samples.shape[0]) / ASR_SAMPLE_RATE,
+            sha256=sha,
+            decoder=decoder,
+        )
+
+    decode_errors: List[Dict[str, str]] = []
+    try:
+        samples, sr = _load_audio_numpy(audio_path, decode_errors, stage_prefix="audio_decode")
+    except Exception:
+        errors.extend(decode_errors)
+        return None
+
+    return DecodedAudio(
+        samples=samples,
+        sample_rate=int(sr),
+        duration_s=float(samples.shape[0]) / float(sr) if sr > 0 else 0.0,
+        sha256=sha,
+        decoder="soundfile/wave",
+    )
+
+
 # =============================================================================
 # ASR
 # =============================================================================
@@ -533,9 +1265,30 @@ class ASRParams:
     compute_type: str
     vad_filter: bool
     beam_size: int
+    cpu_threads: int = 0  # 0 = padrão do CTranslate2; não entra no hash (não altera o resultado)
+    chunk_workers: int = 0  # > 0 = ASR em chunks paralelos; o chunking entra no hash, o nº de workers não
+    batch_size: int = 0  # > 0 = ASR em lote entre arquivos curtos; o recorte entra no hash, o tamanho do lote não
+    escalate_model: str = ""  # != "" = segunda passada com esse modelo nos segmentos de baixa confiança
+
+
+# Caminho que o ASR de um arquivo tomou de fato (FileJob.asr_route): "" = chamada única;
+# chunked = áudio longo com --asr_chunk_workers; batched = lote entre arquivos curtos.
+# Só o caminho tomado entra no hash: ligar as flags não invalida o cache dos demais arquivos.
+ASR_ROUTE_CHUNKED = "chunked"
+ASR_ROUTE_BATCHED = "batched"
+
 
+def _asr_routes(params: ASRParams) -> List[str]:
+    """Caminhos possíveis com estes parâmetros (ordem de preferência na consulta ao cache)."""
+    routes = [""]
+    if params.chunk_workers > 0:
+        routes.append(ASR_ROUTE_CHUNKED)
+    if params.batch_size > 0:
+        routes.append(ASR_ROUTE_BATCHED)
+    return routes
 
-def _params_hash(params: ASRParams) -> str:
+
+def _params_hash(params: ASRParams, route: str = "") -> str:
     payload = {
         "model": params.model,
         "language": params.language,
@@ -545,84 +1298,570 @@ def _params_hash(params: ASRParams) -> str:
         "beam_size": params.beam_size,
         "pipeline": "faster-whisper",
     }
+    if route == ASR_ROUTE_CHUNKED:
+        payload["chunked"] = [ASR_CHUNK_MIN_S, ASR_CHUNK_MAX_S, ASR_CHUNK_OVERLAP_S, ASR_CHUNK_MIN_SILENCE_MS]
+    elif route == ASR_ROUTE_BATCHED:
+        payload["batched"] = [ASR_BATCH_CLIP_S]
+    if params.escalate_model:
+        payload["escalate"] = [params.escalate_model, ESCALATE_BEAM, ESCALATE_LOGPROB, ESCALATE_NO_SPEECH, ESCALATE_PAD_S]
     b = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
     return _sha256_bytes(b)
 
 
-def _run_asr_faster_whisper(audio_path: Path, params: ASRParams, errors: List[Dict[str, str]]) -> List[Dict[str, Any]]:
-    try:
-        from faster_whisper import WhisperModel  # type: ignore
-    except Exception as e:
-        errors.append({"stage": "asr_import", "error": f"{type(e).__name__}: {e}"})
-        return []
+# ------------------------------
+# Cache por etapa
+# ------------------------------
+# ASR bruto: áudio + parâmetros do ASR. Diarização: áudio + pipeline/device. Pós-processamento
+# (merge, pontuação, dicionário, split, papéis): hash dos assets e das constantes — quando só
+# ele muda, o arquivo volta para a fila mas ASR e diarização saem do stage_cache.
+STAGE_ASR = "asr"
+STAGE_DIAR = "diarization"
 
-    try:
-        model = WhisperModel(params.model, device=params.device, compute_type=params.compute_type)
-    except Exception as e:
-        errors.append({"stage": "asr_load_model", "error": f"{type(e).__name__}: {e}"})
-        return []
 
-    segments_out: List[Dict[str, Any]] = []
-    hb_stop: Optional[threading.Event] = None
-    hb_th: Optional[threading.Thread] = None
+def _asr_stage_key(audio_hash: str, params: ASRParams, route: str = "") -> str:
+    return _sha256_bytes(f"{audio_hash}{_params_hash(params, route)}".encode("utf-8"))
 
-    try:
-        hb_stop, hb_th = _start_heartbeat("ASR em execução", every_s=15.0)
-        last_seg_log = time.time()
 
-        seg_iter, _info = model.transcribe(
-            str(audio_path),
-            language=params.language,
-            vad_filter=params.vad_filter,
-            beam_size=params.beam_size,
-        )
+def _diar_stage_key(audio_hash: str, device: str) -> str:
+    payload = json.dumps({"pipeline": PYANNOTE_MODEL_ID, "device": device}, sort_keys=True)
+    return _sha256_bytes(f"{audio_hash}{payload}".encode("utf-8"))
 
-        for seg in seg_iter:
-            now = time.time()
-            if now - last_seg_log >= 60.0:
-                print("  Progresso: ASR processando segmentos")
-                last_seg_log = now
 
-            text = (seg.text or "").strip()
-            if not text:
-                continue
-            segments_out.append({"start": float(seg.start), "end": float(seg.end), "text": text})
+def _asset_hash(path: str) -> str:
+    try:
+        p = Path(path)
+        return _sha256_file(p) if p.exists() else ""
+    except Exception:
+        return ""
 
-    except Exception as e:
-        errors.append({"stage": "asr_transcribe", "error": f"{type(e).__name__}: {e}"})
-        return []
-    finally:
-        if hb_stop is not None and hb_th is not None:
-            _stop_heartbeat(hb_stop, hb_th)
 
-    return segments_out
+def _post_hash(
+    dict_path: str,
+    roles_vendor_path: str,
+    roles_client_path: str,
+    punctuation: bool,
+    dict_fuzzy: str = "",
+    punct_batch_size: int = PUNCT_BATCH_SIZE,
+) -> str:
+    payload = {
+        "assets": {
+            "dict": _asset_hash(dict_path),
+            "roles_vendor": _asset_hash(roles_vendor_path),
+            "roles_client": _asset_hash(roles_client_path),
+        },
+        "constants": {
+            "DIAR_COLLAPSE_MAX_SHARE": DIAR_COLLAPSE_MAX_SHARE,
+            "DIAR_MIN_COVERAGE": DIAR_MIN_COVERAGE,
+            "MERGE_MAX_CHARS": MERGE_MAX_CHARS,
+            "MERGE_SHORT_MAX_WORDS": MERGE_SHORT_MAX_WORDS,
+            "MERGE_MAX_GAP_S": MERGE_MAX_GAP_S,
+            "SPLIT_MIN_SENT_CHARS": SPLIT_MIN_SENT_CHARS,
+            "SPLIT_MAX_SENTENCES_PER_SEG": SPLIT_MAX_SENTENCES_PER_SEG,
+            "SPLIT_ENABLE": SPLIT_ENABLE,
+            "DICT_FUZZY_THRESHOLD": DICT_FUZZY_THRESHOLD,
+            "FUZZY_THRESHOLD": FUZZY_THRESHOLD,
+            "FUZZY_WEIGHT_FACTOR": FUZZY_WEIGHT_FACTOR,
+            "CONF_NORM": CONF_NORM,
+            "ROLE_STRONG_MIN": ROLE_STRONG_MIN,
+            "ISLAND_MAX_LEN": ISLAND_MAX_LEN,
+            "SHORT_CLIENT_MAX_WORDS": SHORT_CLIENT_MAX_WORDS,
+        },
+        "punctuation": bool(punctuation),
+        # chunking e lote da pontuação mudam o texto pontuado; sem pontuação não importam
+        "punct": {
+            "PUNCT_CHUNK_WORDS": PUNCT_CHUNK_WORDS,
+            "PUNCT_CHUNK_OVERLAP": PUNCT_CHUNK_OVERLAP,
+            "batch_size": int(punct_batch_size),
+        } if punctuation else {},
+        "dict_fuzzy": dict_fuzzy,
+    }
+    b = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return _sha256_bytes(b)
 
 
-# =============================================================================
-# Pyannote diarização (mantido)
-# =============================================================================
-def _load_pyannote_pipeline(hf_token: str, device: str, errors: List[Dict[str, str]]):
+# Leitura do stage_cache nas threads/processos das etapas: uma conexão por thread (sqlite3 não
+# compartilha conexões entre threads). A escrita fica com a conexão do processo principal.
+# Quem abre fecha: threads de etapa ao sair, workers do pool ao fim de cada arquivo, main no fim.
+_STAGE_DB_LOCAL = threading.local()
+
+
+def _stage_cache_get(db_path: str, stage: str, stage_key: str, errors: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
     try:
-        from pyannote.audio import Pipeline  # type: ignore
+        db = getattr(_STAGE_DB_LOCAL, "db", None)
+        if db is None or str(db.db_path) != db_path:
+            db = CacheDB(Path(db_path))
+            _STAGE_DB_LOCAL.db = db
+        return db.get_stage(stage, stage_key)
     except Exception as e:
-        errors.append({"stage": "diar_import", "error": f"{type(e).__name__}: {e}"})
+        errors.append({"stage": f"stage_cache_{stage}", "error": f"{type(e).__name__}: {e}"})
         return None
 
-    model_id = "pyannote/speaker-diarization-3.1"
-    variants = [{"token": hf_token}, {"hf_token": hf_token}, {"use_auth_token": hf_token}]
 
-    last_exc: Optional[Exception] = None
-    for kwargs in variants:
+def _close_stage_db() -> None:
+    """Fecha a conexão de leitura do stage_cache aberta pela thread corrente (se houver)."""
+    db = getattr(_STAGE_DB_LOCAL, "db", None)
+    _STAGE_DB_LOCAL.db = None
+    if db is not None:
         try:
-            pipe = Pipeline.from_pretrained(model_id, **kwargs)
-            try:
-                if hasattr(pipe, "to"):
-                    pipe.to(device)
-            except Exception:
-                pass
-            return pipe
-        except TypeError as e:
-            last_exc = e
+            db.close()
+        except Exception:
+            pass
+
+
+# Registro de modelos: um WhisperModel por (model, device, compute_type, cpu_threads, workers), reutilizado
+# por todos os arquivos da execução e liberado explicitamente no final do main().
+_ASR_MODELS: Dict[Tuple[str, str, str, int, int], Any] = {}
+_ASR_MODELS_LOCK = threading.Lock()
+
+
+def _asr_model_key(params: ASRParams) -> Tuple[str, str, str, int, int]:
+    return (params.model, params.device, params.compute_type, int(params.cpu_threads), max(1, int(params.chunk_workers)))
+
+
+def _get_whisper_model(params: ASRParams, errors: List[Dict[str, str]]):
+    key = _asr_model_key(params)
+    with _ASR_MODELS_LOCK:
+        model = _ASR_MODELS.get(key)
+        if model is not None:
+            return model
+
+        try:
+            from faster_whisper import WhisperModel  # type: ignore
+        except Exception as e:
+            errors.append({"stage": "asr_import", "error": f"{type(e).__name__}: {e}"})
+            return None
+
+        try:
+            t_load = time.time()
+            model = WhisperModel(
+                params.model,
+                device=params.device,
+                compute_type=params.compute_type,
+                cpu_threads=int(params.cpu_threads),
+                # num_workers > 1: transcribe() chamado de várias threads roda de fato em paralelo
+                num_workers=max(1, int(params.chunk_workers)),
+            )
+        except Exception as e:
+            errors.append({"stage": "asr_load_model", "error": f"{type(e).__name__}: {e}"})
+            return None
+
+        _ASR_MODELS[key] = model
+        print(f"  Modelo ASR carregado: {params.model} | device={params.device} | compute_type={params.compute_type} | {_format_elapsed(time.time() - t_load)}")
+        return model
+
+
+def _release_whisper_models() -> None:
+    with _ASR_MODELS_LOCK:
+        models = list(_ASR_MODELS.values())
+        _ASR_MODELS.clear()
+    if not models:
+        return
+    del models
+    try:
+        import gc
+        gc.collect()
+    except Exception:
+        pass
+
+
+def _plan_asr_chunks(samples: Any, errors: List[Dict[str, str]]) -> List[Tuple[float, float, float, float]]:
+    """
+    Cortes do ASR em chunks: (início_clip, fim_clip, início_próprio, fim_próprio), em segundos.
+    Cada corte cai no meio do maior silêncio (VAD do faster-whisper) entre ASR_CHUNK_MIN_S e
+    ASR_CHUNK_MAX_S do corte anterior. Sem silêncio na janela, corta em ASR_CHUNK_MAX_S e os
+    dois chunks vizinhos se sobrepõem em ASR_CHUNK_OVERLAP_S; cada segmento pertence ao chunk
+    que contém o seu ponto médio (faixa própria), o que elimina as duplicatas da sobreposição.
+    """
+    duration = len(samples) / float(ASR_SAMPLE_RATE)
+    gaps: List[Tuple[float, float]] = []
+    try:
+        from faster_whisper.vad import VadOptions, get_speech_timestamps  # type: ignore
+
+        speech = get_speech_timestamps(samples, VadOptions(min_silence_duration_ms=ASR_CHUNK_MIN_SILENCE_MS))
+        for a, b in zip(speech, speech[1:]):
+            gaps.append((a["end"] / float(ASR_SAMPLE_RATE), b["start"] / float(ASR_SAMPLE_RATE)))
+    except Exception as e:
+        errors.append({"stage": "asr_chunk_vad", "error": f"{type(e).__name__}: {e}"})
+
+    cuts: List[Tuple[float, bool]] = []  # (instante, forçado)
+    pos = 0.0
+    while duration - pos > ASR_CHUNK_MAX_S:
+        window = [g for g in gaps if pos + ASR_CHUNK_MIN_S <= (g[0] + g[1]) / 2.0 <= pos + ASR_CHUNK_MAX_S]
+        if window:
+            g = max(window, key=lambda g: g[1] - g[0])
+            cut, forced = (g[0] + g[1]) / 2.0, False
+        else:
+            cut, forced = pos + ASR_CHUNK_MAX_S, True
+        cuts.append((cut, forced))
+        pos = cut
+
+    chunks: List[Tuple[float, float, float, float]] = []
+    prev, prev_forced = 0.0, False
+    for cut, forced in cuts + [(duration, False)]:
+        clip_start = max(0.0, prev - (ASR_CHUNK_OVERLAP_S if prev_forced else 0.0))
+        clip_end = min(duration, cut + (ASR_CHUNK_OVERLAP_S if forced else 0.0))
+        chunks.append((clip_start, clip_end, prev, cut))
+        prev, prev_forced = cut, forced
+    return chunks
+
+
+def _transcribe_chunked(
+    model: Any,
+    samples: Any,
+    params: ASRParams,
+    emit: Callable[[Dict[str, Any]], None],
+    errors: List[Dict[str, str]],
+) -> int:
+    """
+    Transcreve os chunks de _plan_asr_chunks em paralelo (threads; o modelo tem num_workers =
+    chunk_workers) e entrega os segmentos em ordem, já com o tempo absoluto. Devolve nº de chunks.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    chunks = _plan_asr_chunks(samples, errors)
+    last = len(chunks) - 1
+
+    def _run(k: int) -> List[Dict[str, Any]]:
+        clip_start, clip_end, own_start, own_end = chunks[k]
+        a, b = int(round(clip_start * ASR_SAMPLE_RATE)), int(round(clip_end * ASR_SAMPLE_RATE))
+        seg_iter, _info = model.transcribe(
+            samples[a:b],
+            language=params.language,
+            vad_filter=params.vad_filter,
+            beam_size=params.beam_size,
+        )
+        out: List[Dict[str, Any]] = []
+        for seg in seg_iter:
+            text = (seg.text or "").strip()
+            if not text:
+                continue
+            start, end = clip_start + float(seg.start), clip_start + float(seg.end)
+            mid = (start + end) / 2.0
+            if mid < own_start or (mid >= own_end and k != last):
+                continue  # pertence ao chunk vizinho (sobreposição)
+            out.append({"start": start, "end": end, "text": text})
+            if params.escalate_model:
+                out[-1].update(_seg_confidence(seg))
+        return out
+
+    with ThreadPoolExecutor(max_workers=max(1, int(params.chunk_workers))) as ex:
+        futs = [ex.submit(_run, k) for k in range(len(chunks))]
+        for fut in futs:  # em ordem: a saída parcial recebe os segmentos na sequência do áudio
+            for seg in fut.result():
+                emit(seg)
+    return len(chunks)
+
+
+def _seg_confidence(seg: Any) -> Dict[str, float]:
+    """Confiança do segmento (chaves internas, removidas antes de sair do ASR)."""
+    return {"_lp": float(getattr(seg, "avg_logprob", 0.0) or 0.0), "_nsp": float(getattr(seg, "no_speech_prob", 0.0) or 0.0)}
+
+
+def _strip_confidence(segments: List[Dict[str, Any]]) -> None:
+    for seg in segments:
+        seg.pop("_lp", None)
+        seg.pop("_nsp", None)
+
+
+def _escalate_low_confidence(
+    segments: List[Dict[str, Any]],
+    samples: Any,
+    params: ASRParams,
+    errors: List[Dict[str, str]],
+    stats: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """
+    Segunda passada: sequências de segmentos com avg_logprob baixo ou no_speech_prob alto são
+    retranscritas com params.escalate_model sobre o mesmo trecho de áudio (sem invadir os
+    vizinhos) e substituídas pelo resultado; trecho que volta vazio é descartado.
+    """
+    low = [
+        i for i, seg in enumerate(segments)
+        if seg.get("_lp", 0.0) < ESCALATE_LOGPROB or seg.get("_nsp", 0.0) > ESCALATE_NO_SPEECH
+    ]
+    stats.update({"model": params.escalate_model, "low_confidence": len(low), "spans": 0, "new_segments": 0})
+    if not low:
+        return segments
+
+    esc_params = replace(params, model=params.escalate_model, beam_size=ESCALATE_BEAM, escalate_model="", chunk_workers=0, batch_size=0)
+    model = _get_whisper_model(esc_params, errors)
+    if model is None:
+        return segments
+
+    spans: List[List[int]] = []
+    for i in low:
+        if spans and spans[-1][1] == i - 1:
+            spans[-1][1] = i
+        else:
+            spans.append([i, i])
+
+    tick = time.time()
+    duration = len(samples) / float(ASR_SAMPLE_RATE)
+    out: List[Dict[str, Any]] = []
+    prev = 0
+    for i0, i1 in spans:
+        out.extend(segments[prev:i0])
+        prev = i1 + 1
+        lo = max(0.0, segments[i0]["start"] - ESCALATE_PAD_S, segments[i0 - 1]["end"] if i0 > 0 else 0.0)
+        hi = min(duration, segments[i1]["end"] + ESCALATE_PAD_S, segments[i1 + 1]["start"] if i1 + 1 < len(segments) else duration)
+        try:
+            seg_iter, _info = model.transcribe(
+                samples[int(lo * ASR_SAMPLE_RATE):int(hi * ASR_SAMPLE_RATE)],
+                language=params.language,
+                vad_filter=params.vad_filter,
+                beam_size=ESCALATE_BEAM,
+            )
+            new = [
+                {"start": min(hi, lo + float(seg.start)), "end": min(hi, lo + float(seg.end)), "text": (seg.text or "").strip()}
+                for seg in seg_iter
+            ]
+        except Exception as e:
+            errors.append({"stage": "asr_escalate", "error": f"{type(e).__name__}: {e}"})
+            out.extend(segments[i0:i1 + 1])
+            continue
+        new = [seg for seg in new if seg["text"]]
+        out.extend(new)
+        stats["spans"] += 1
+        stats["new_segments"] += len(new)
+    out.extend(segments[prev:])
+    stats["elapsed_s"] = round(time.time() - tick, 3)
+    return out
+
+
+def _chunk_params(params: ASRParams) -> ASRParams:
+    """
+    Parâmetros do caminho em chunks: os núcleos (do processo ou do worker) são divididos entre
+    os chunks simultâneos. Só esse caminho usa a divisão; chamada única, lote e segunda passada
+    seguem com params.cpu_threads inteiro (o registro de modelos separa os dois pelo cpu_threads).
+    """
+    base = params.cpu_threads if params.cpu_threads > 0 else (os.cpu_count() or 1)
+    return replace(params, cpu_threads=max(1, base // max(1, int(params.chunk_workers))))
+
+
+def _uses_chunks(params: ASRParams, audio: Optional[DecodedAudio]) -> bool:
+    return (
+        params.chunk_workers > 0
+        and audio is not None
+        and audio.sample_rate == ASR_SAMPLE_RATE
+        and audio.duration_s > ASR_CHUNK_MAX_S
+    )
+
+
+def _run_asr_faster_whisper(
+    audio_path: Path,
+    params: ASRParams,
+    errors: List[Dict[str, str]],
+    audio: Optional[DecodedAudio] = None,
+    on_segment: Optional[Callable[[Dict[str, Any]], None]] = None,
+    esc_stats: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    on_segment: chamado com cada segmento assim que sai do gerador (saída parcial em streaming).
+    Com params.escalate_model, a segunda passada roda no fim e esc_stats recebe o resumo.
+    """
+    chunked = _uses_chunks(params, audio)
+    model = _get_whisper_model(_chunk_params(params) if chunked else params, errors)
+    if model is None:
+        return []
+
+    segments_out: List[Dict[str, Any]] = []
+    hb_stop: Optional[threading.Event] = None
+    hb_th: Optional[threading.Thread] = None
+    total_s = audio.duration_s if audio is not None else None
+
+    def _status() -> str:
+        done_s = segments_out[-1]["end"] if segments_out else 0.0
+        of_total = f"/{total_s:.0f}s" if total_s else "s"
+        return f"segmentos {len(segments_out)} | áudio {done_s:.0f}{of_total}"
+
+    def _emit(seg: Dict[str, Any]) -> None:
+        nonlocal on_segment
+        segments_out.append(seg)
+        if on_segment is not None:
+            try:
+                on_segment(seg)
+            except Exception as e_cb:
+                # saída parcial é acessória: nunca derruba o ASR
+                errors.append({"stage": "partial_on_segment", "error": f"{type(e_cb).__name__}: {e_cb}"})
+                on_segment = None
+
+    try:
+        hb_stop, hb_th = _start_heartbeat("ASR em execução", every_s=15.0, status=_status)
+        last_seg_log = time.time()
+
+        decoded = audio is not None and audio.sample_rate == ASR_SAMPLE_RATE
+        if chunked:
+            t_chunks = time.time()
+            n_chunks = _transcribe_chunked(model, audio.samples, params, _emit, errors)
+            print(f"  ASR em chunks: {n_chunks} chunks | {params.chunk_workers} em paralelo | {_format_elapsed(time.time() - t_chunks)}")
+            return _finish_escalation(segments_out, audio, params, errors, esc_stats)
+
+        # áudio já decodificado (16 kHz mono) evita uma segunda leitura/decodificação do arquivo
+        asr_input = audio.samples if decoded else str(audio_path)
+        seg_iter, _info = model.transcribe(
+            asr_input,
+            language=params.language,
+            vad_filter=params.vad_filter,
+            beam_size=params.beam_size,
+        )
+
+        for seg in seg_iter:
+            now = time.time()
+            if now - last_seg_log >= 60.0:
+                print("  Progresso: ASR processando segmentos")
+                last_seg_log = now
+
+            text = (seg.text or "").strip()
+            if not text:
+                continue
+            _emit({"start": float(seg.start), "end": float(seg.end), "text": text})
+            if params.escalate_model:
+                segments_out[-1].update(_seg_confidence(seg))
+
+    except Exception as e:
+        errors.append({"stage": "asr_transcribe", "error": f"{type(e).__name__}: {e}"})
+        return []
+    finally:
+        if hb_stop is not None and hb_th is not None:
+            _stop_heartbeat(hb_stop, hb_th)
+
+    return _finish_escalation(segments_out, audio, params, errors, esc_stats)
+
+
+def _finish_escalation(
+    segments: List[Dict[str, Any]],
+    audio: Optional[DecodedAudio],
+    params: ASRParams,
+    errors: List[Dict[str, str]],
+    esc_stats: Optional[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """Segunda passada (se ligada e com áudio decodificado em 16 kHz) e remoção das chaves de confiança."""
+    if params.escalate_model and audio is not None and audio.sample_rate == ASR_SAMPLE_RATE:
+        segments = _escalate_low_confidence(segments, audio.samples, params, errors, esc_stats if esc_stats is not None else {})
+    _strip_confidence(segments)
+    return segments
+
+
+def _batch_clips(samples: Any, vad_filter: bool) -> List[List[Tuple[int, int]]]:
+    """Trechos de fala (amostras) de um arquivo agrupados em clips de até ASR_BATCH_CLIP_S."""
+    max_len = int(ASR_BATCH_CLIP_S * ASR_SAMPLE_RATE)
+    if vad_filter:
+        from faster_whisper.vad import VadOptions, get_speech_timestamps  # type: ignore
+
+        # mesmos parâmetros que o BatchedInferencePipeline usa ao recortar um arquivo sozinho
+        speech = get_speech_timestamps(samples, VadOptions(max_speech_duration_s=ASR_BATCH_CLIP_S, min_silence_duration_ms=160))
+        regions = [(int(r["start"]), int(r["end"])) for r in speech if int(r["end"]) > int(r["start"])]
+    else:
+        regions = [(a, min(len(samples), a + max_len)) for a in range(0, len(samples), max_len)]
+
+    clips: List[List[Tuple[int, int]]] = []
+    cur: List[Tuple[int, int]] = []
+    cur_len = 0
+    for a, b in regions:
+        if cur and cur_len + (b - a) > max_len:
+            clips.append(cur)
+            cur, cur_len = [], 0
+        cur.append((a, b))
+        cur_len += b - a
+    if cur:
+        clips.append(cur)
+    return clips
+
+
+def _run_asr_batched(
+    samples_list: List[Any],
+    params: ASRParams,
+    errors_list: List[List[Dict[str, str]]],
+) -> Optional[List[List[Dict[str, Any]]]]:
+    """
+    Transcreve vários arquivos curtos numa única chamada do BatchedInferencePipeline.
+    A fala de cada arquivo (VAD) é agrupada em clips de até 30 s, os clips de todos os arquivos
+    são concatenados num único buffer e passados como clip_timestamps; cada segmento volta ao
+    seu arquivo e ao tempo original pela tabela de trechos. None = falhou (caminho normal).
+    """
+    model = _get_whisper_model(params, errors_list[0])
+    if model is None:
+        return None
+    try:
+        from faster_whisper import BatchedInferencePipeline  # type: ignore
+
+        pieces: List[Any] = []
+        clip_ts: List[Dict[str, float]] = []
+        # trechos em ordem no buffer: (início no buffer, fim no buffer, arquivo, início no arquivo), em amostras
+        regions: List[Tuple[int, int, int, int]] = []
+        pos = 0
+        for i, samples in enumerate(samples_list):
+            for clip in _batch_clips(samples, params.vad_filter):
+                clip_start = pos
+                for a, b in clip:
+                    pieces.append(samples[a:b])
+                    regions.append((pos, pos + (b - a), i, a))
+                    pos += b - a
+                clip_ts.append({"start": clip_start / float(ASR_SAMPLE_RATE), "end": pos / float(ASR_SAMPLE_RATE)})
+
+        out: List[List[Dict[str, Any]]] = [[] for _ in samples_list]
+        if not clip_ts:
+            return out  # nenhum trecho de fala em nenhum arquivo
+
+        starts = [r[0] for r in regions]
+
+        def _orig(t: float, is_end: bool) -> Tuple[int, float]:
+            x = int(round(t * ASR_SAMPLE_RATE))
+            k = (bisect.bisect_left(starts, x) if is_end else bisect.bisect_right(starts, x)) - 1
+            r0, r1, i, a = regions[max(0, k)]
+            return i, (a + min(max(x, r0), r1) - r0) / float(ASR_SAMPLE_RATE)
+
+        pipe = BatchedInferencePipeline(model)
+        seg_iter, _info = pipe.transcribe(
+            np.concatenate(pieces),
+            language=params.language,
+            beam_size=params.beam_size,
+            vad_filter=False,
+            clip_timestamps=clip_ts,
+            batch_size=int(params.batch_size),
+            without_timestamps=False,
+        )
+        for seg in seg_iter:
+            text = (seg.text or "").strip()
+            if not text:
+                continue
+            i, start = _orig(float(seg.start), is_end=False)
+            _i_end, end = _orig(float(seg.end), is_end=True)
+            out[i].append({"start": start, "end": max(start, end), "text": text})
+            if params.escalate_model:
+                out[i][-1].update(_seg_confidence(seg))
+        return out
+    except Exception as e:
+        for errors in errors_list:
+            errors.append({"stage": "asr_batched", "error": f"{type(e).__name__}: {e}"})
+        return None
+
+
+# =============================================================================
+# Pyannote diarização (mantido)
+# =============================================================================
+def _load_pyannote_pipeline(hf_token: str, device: str, errors: List[Dict[str, str]]):
+    try:
+        from pyannote.audio import Pipeline  # type: ignore
+    except Exception as e:
+        errors.append({"stage": "diar_import", "error": f"{type(e).__name__}: {e}"})
+        return None
+
+    model_id = PYANNOTE_MODEL_ID
+    variants = [{"token": hf_token}, {"hf_token": hf_token}, {"use_auth_token": hf_token}]
+
+    last_exc: Optional[Exception] = None
+    for kwargs in variants:
+        try:
+            pipe = Pipeline.from_pretrained(model_id, **kwargs)
+            try:
+                if hasattr(pipe, "to"):
+                    pipe.to(device)
+            except Exception:
+                pass
+            return pipe
+        except TypeError as e:
+            last_exc = e
             continue
         except Exception as e:
             last_exc = e
@@ -632,23 +1871,96 @@ def _load_pyannote_pipeline(hf_token: str, device: str, errors: List[Dict[str, s
     return None
 
 
-def _preload_audio_no_torchcodec(audio_path: Path, errors: List[Dict[str, str]]):
+# Cache de processo: o pipeline é carregado na primeira diarização e reutilizado pelos
+# arquivos seguintes. Falhas de carga ficam registradas para não repetir N vezes.
+_PYANNOTE_PIPELINES: Dict[str, Any] = {}
+_PYANNOTE_FAILURES: Dict[str, Dict[str, str]] = {}
+_PYANNOTE_LOCK = threading.Lock()
+
+
+def _get_pyannote_pipeline(hf_token: str, device: str, errors: List[Dict[str, str]]):
+    with _PYANNOTE_LOCK:
+        pipe = _PYANNOTE_PIPELINES.get(device)
+        if pipe is not None:
+            return pipe
+
+        failure = _PYANNOTE_FAILURES.get(device)
+        if failure is not None:
+            errors.append({"stage": "diar_load_pipeline_cached", "error": failure.get("error", "")})
+            return None
+
+        load_errors: List[Dict[str, str]] = []
+        t_load = time.time()
+        pipe = _load_pyannote_pipeline(hf_token, device, load_errors)
+        errors.extend(load_errors)
+
+        if pipe is None:
+            _PYANNOTE_FAILURES[device] = load_errors[-1] if load_errors else {"stage": "diar_load_pipeline", "error": "unknown"}
+            print(f"  Pipeline pyannote indisponível (device={device}); diarização desativada nesta execução.")
+            return None
+
+        _PYANNOTE_PIPELINES[device] = pipe
+        print(f"  Pipeline pyannote carregado: device={device} | {_format_elapsed(time.time() - t_load)}")
+        return pipe
+
+
+# serializa a aplicação do pipeline (uma instância por device, compartilhada): com --pipeline e
+# --diar_parallel a diarização do próximo arquivo pode começar antes de a anterior terminar.
+# Só uma roda por vez, e o tensor de waveform só existe para a que está rodando.
+_DIAR_RUN_LOCK = threading.Lock()
+
+
+def _release_pyannote_pipelines() -> None:
+    with _PYANNOTE_LOCK:
+        pipes = list(_PYANNOTE_PIPELINES.values())
+        _PYANNOTE_PIPELINES.clear()
+        _PYANNOTE_FAILURES.clear()
+    if not pipes:
+        return
+    del pipes
+    try:
+        import gc
+        gc.collect()
+    except Exception:
+        pass
+
+
+def _load_audio_numpy(audio_path: Path, errors: List[Dict[str, str]], stage_prefix: str = "diar_preload"):
+    """
+    Lê o áudio em taxa nativa (soundfile; fallback wave para WAV PCM) e devolve (mono float32, sr).
+    A leitura é em blocos de AUDIO_BLOCK_FRAMES: cada bloco é convertido/mixado direto para um
+    buffer float32 pré-alocado, então o pico de memória é ~1 cópia do áudio mono (+1 bloco),
+    em vez de multicanal + média + cópia para o torch.
+    """
     try:
         import soundfile as sf  # type: ignore
-        import torch  # type: ignore
 
-        data, sr = sf.read(str(audio_path), dtype="float32", always_2d=True)
-        mono = data.mean(axis=1)
-        waveform = torch.from_numpy(mono).unsqueeze(0)
-        if waveform.dtype != torch.float32:
-            waveform = waveform.to(torch.float32)
-        return waveform, int(sr)
+        with sf.SoundFile(str(audio_path)) as f:
+            sr = int(f.samplerate)
+            n_channels = int(f.channels)
+            n_frames = int(f.frames)
+            out = np.empty(max(0, n_frames), dtype=np.float32)
+            block = np.empty((AUDIO_BLOCK_FRAMES, n_channels), dtype=np.float32)
+
+            pos = 0
+            while pos < n_frames:
+                want = min(AUDIO_BLOCK_FRAMES, n_frames - pos)
+                got_arr = f.read(frames=want, dtype="float32", always_2d=True, out=block[:want])
+                got = int(got_arr.shape[0])
+                if got <= 0:
+                    break
+                if n_channels == 1:
+                    out[pos:pos + got] = got_arr[:, 0]
+                else:
+                    np.mean(got_arr, axis=1, out=out[pos:pos + got])
+                pos += got
+
+        return out[:pos], sr
     except Exception as e_sf:
-        errors.append({"stage": "diar_preload_sf", "error": f"{type(e_sf).__name__}: {e_sf}"})
+        errors.append({"stage": f"{stage_prefix}_sf", "error": f"{type(e_sf).__name__}: {e_sf}"})
 
     try:
         import wave
-        import torch  # type: ignore
 
         if audio_path.suffix.lower() != ".wav":
             raise RuntimeError("fallback wave suporta apenas WAV PCM")
@@ -658,28 +1970,55 @@ def _preload_audio_no_torchcodec(audio_path: Path, errors: List[Dict[str, str]])
             n_channels = wf.getnchannels()
             sampwidth = wf.getsampwidth()
             n_frames = wf.getnframes()
-            raw = wf.readframes(n_frames)
-
-        if sampwidth == 2:
-            audio = np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
-        elif sampwidth == 4:
-            audio = np.frombuffer(raw, dtype=np.int32).astype(np.float32) / 2147483648.0
-        else:
-            raise RuntimeError(f"sampwidth não suportado no fallback wave: {sampwidth}")
 
-        if n_channels > 1:
-            audio = audio.reshape(-1, n_channels).mean(axis=1)
+            if sampwidth == 2:
+                pcm_dtype, scale = np.int16, np.float32(32768.0)
+            elif sampwidth == 4:
+                pcm_dtype, scale = np.int32, np.float32(2147483648.0)
+            else:
+                raise RuntimeError(f"sampwidth não suportado no fallback wave: {sampwidth}")
+
+            out = np.empty(max(0, n_frames), dtype=np.float32)
+            pos = 0
+            while pos < n_frames:
+                raw = wf.readframes(min(AUDIO_BLOCK_FRAMES, n_frames - pos))
+                if not raw:
+                    break
+                pcm = np.frombuffer(raw, dtype=pcm_dtype)
+                got = pcm.shape[0] // max(1, n_channels)
+                if got <= 0:
+                    break
+                if n_channels > 1:
+                    blk = pcm[: got * n_channels].astype(np.float32) / scale
+                    np.mean(blk.reshape(-1, n_channels), axis=1, out=out[pos:pos + got])
+                else:
+                    np.divide(pcm[:got], scale, out=out[pos:pos + got])
+                pos += got
 
-        waveform = torch.from_numpy(audio).unsqueeze(0)
-        if waveform.dtype != torch.float32:
-            waveform = waveform.to(torch.float32)
-        return waveform, int(sr)
+        return out[:pos], int(sr)
 
     except Exception as e_w:
-        errors.append({"stage": "diar_preload_wave", "error": f"{type(e_w).__name__}: {e_w}"})
+        errors.append({"stage": f"{stage_prefix}_wave", "error": f"{type(e_w).__name__}: {e_w}"})
         raise RuntimeError("preload_failed_no_torchcodec") from e_w
 
 
+def _waveform_tensor(samples: Any):
+    import torch  # type: ignore
+
+    waveform = torch.from_numpy(samples).unsqueeze(0)
+    if waveform.dtype != torch.float32:
+        waveform = waveform.to(torch.float32)
+    return waveform
+
+
+def _preload_audio_no_torchcodec(audio_path: Path, errors: List[Dict[str, str]], audio: Optional[DecodedAudio] = None):
+    if audio is not None:
+        return _waveform_tensor(audio.samples), int(audio.sample_rate)
+
+    samples, sr = _load_audio_numpy(audio_path, errors, stage_prefix="diar_preload")
+    return _waveform_tensor(samples), int(sr)
+
+
 def _extract_annotation(diar_obj: Any, errors: List[Dict[str, str]]):
     try:
         if diar_obj is None:
@@ -717,25 +2056,33 @@ def _extract_annotation(diar_obj: Any, errors: List[Dict[str, str]]):
         return None
 
 
-def _run_diarization_pyannote(audio_path: Path, hf_token: str, device: str, errors: List[Dict[str, str]]):
-    pipe = _load_pyannote_pipeline(hf_token, device, errors)
+def _run_diarization_pyannote(
+    audio_path: Path,
+    hf_token: str,
+    device: str,
+    errors: List[Dict[str, str]],
+    audio: Optional[DecodedAudio] = None,
+):
+    pipe = _get_pyannote_pipeline(hf_token, device, errors)
     if pipe is None:
         return None, False, "pipeline_load_failed"
 
     hb_stop, hb_th = _start_heartbeat("Diarização em execução", every_s=15.0)
 
     try:
-        try:
-            waveform, sample_rate = _preload_audio_no_torchcodec(audio_path, errors)
-        except Exception as e_pre:
-            errors.append({"stage": "diar_preload", "error": f"{type(e_pre).__name__}: {e_pre}"})
-            return None, False, "preload_failed"
+        with _DIAR_RUN_LOCK:
+            try:
+                waveform, sample_rate = _preload_audio_no_torchcodec(audio_path, errors, audio=audio)
+            except Exception as e_pre:
+                errors.append({"stage": "diar_preload", "error": f"{type(e_pre).__name__}: {e_pre}"})
+                return None, False, "preload_failed"
 
-        try:
-            diar_raw = pipe({"waveform": waveform, "sample_rate": int(sample_rate)})
-        except Exception as e_apply:
-            errors.append({"stage": "diar_apply", "error": f"{type(e_apply).__name__}: {e_apply}"})
-            return None, False, "pipeline_apply_failed"
+            try:
+                diar_raw = pipe({"waveform": waveform, "sample_rate": int(sample_rate)})
+            except Exception as e_apply:
+                errors.append({"stage": "diar_apply", "error": f"{type(e_apply).__name__}: {e_apply}"})
+                return None, False, "pipeline_apply_failed"
+            del waveform
 
         ann = _extract_annotation(diar_raw, errors)
         if ann is None:
@@ -758,51 +2105,135 @@ def _run_diarization_pyannote(audio_path: Path, hf_token: str, device: str, erro
         _stop_heartbeat(hb_stop, hb_th)
 
 
-def _assign_speakers_to_segments(asr_segments: List[Dict[str, Any]], ann) -> List[Dict[str, Any]]:
-    turns: List[Tuple[float, float, str]] = []
-    for segment, _, speaker in ann.itertracks(yield_label=True):
-        turns.append((float(segment.start), float(segment.end), str(speaker)))
+@dataclass(frozen=True)
+class _TurnSegment:
+    start: float
+    end: float
 
-    def overlap(a0: float, a1: float, b0: float, b1: float) -> float:
-        return max(0.0, min(a1, b1) - max(a0, b0))
 
-    def normalize_label(raw: str) -> str:
-        r = (raw or "").strip()
-        m = re.match(r"^SPEAKER_(\d{1,2})$", r, flags=re.IGNORECASE)
-        if m:
-            n = int(m.group(1))
-            return f"SPEAKER_{n:02d}"
-        m = re.search(r"(\d{1,2})$", r)
-        if m:
-            n = int(m.group(1))
-            return f"SPEAKER_{n:02d}"
-        return "SPEAKER_02"
+class _TurnsAnnotation:
+    """Annotation reconstruído do stage_cache: só expõe itertracks, que é o que o pipeline consome."""
+
+    def __init__(self, turns: List[List[Any]]):
+        self.turns = [(float(t[0]), float(t[1]), str(t[2])) for t in turns]
+
+    def itertracks(self, yield_label: bool = False):
+        for k, (ts, te, lab) in enumerate(self.turns):
+            if yield_label:
+                yield _TurnSegment(ts, te), k, lab
+            else:
+                yield _TurnSegment(ts, te), k
+
+
+def _annotation_turns(ann) -> List[List[Any]]:
+    return [[float(seg.start), float(seg.end), str(lab)] for seg, _, lab in ann.itertracks(yield_label=True)]
+
+
+def _diarization_from_turns(turns: List[List[Any]]):
+    """Mesmo contrato de _run_diarization_pyannote (ann, ok, reason) a partir dos turnos em cache."""
+    ann = _TurnsAnnotation(turns)
+    if len({t[2] for t in ann.turns}) < 2:
+        return ann, False, "single_speaker"
+    return ann, True, "ok"
+
+
+def _normalize_speaker_label(raw: str) -> str:
+    r = (raw or "").strip()
+    m = re.match(r"^SPEAKER_(\d{1,2})$", r, flags=re.IGNORECASE)
+    if m:
+        n = int(m.group(1))
+        return f"SPEAKER_{n:02d}"
+    m = re.search(r"(\d{1,2})$", r)
+    if m:
+        n = int(m.group(1))
+        return f"SPEAKER_{n:02d}"
+    return "SPEAKER_02"
+
+
+def _assign_speakers_to_segments(asr_segments: List[Dict[str, Any]], ann) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Atribui a cada segmento o speaker de maior sobreposição, olhando só os turnos que
+    podem sobrepor o segmento (índice por início + máximo acumulado dos fins, via bisect).
+    No mesmo passe calcula a cobertura usada em assess_diarization_quality, a duração por
+    speaker e, por segmento, a sobreposição de cada speaker (speaker_overlaps) quando há
+    mais de um; overlap_speech marca segmentos em que os turnos se sobrepõem entre si.
+    """
+    turns: List[Tuple[float, float, str, int]] = []
+    spk_dur: Dict[str, float] = {}
+    for k, (segment, _, speaker) in enumerate(ann.itertracks(yield_label=True)):
+        ts, te = float(segment.start), float(segment.end)
+        turns.append((ts, te, str(speaker), k))
+        spk_dur[str(speaker)] = spk_dur.get(str(speaker), 0.0) + max(0.0, te - ts)
+
+    turns.sort(key=lambda t: t[0])
+    starts = [t[0] for t in turns]
+    max_end: List[float] = []
+    run = float("-inf")
+    for t in turns:
+        run = max(run, t[1])
+        max_end.append(run)
 
     enriched: List[Dict[str, Any]] = []
+    seg_total = 0.0
+    ov_total = 0.0
+    multi_speaker = 0
+    overlap_speech = 0
+
     for seg in asr_segments:
         st = float(seg.get("start", 0.0))
         en = float(seg.get("end", st))
         dur = max(0.0, en - st)
 
+        lo = bisect.bisect_right(max_end, st)   # antes de lo, todo turno termina até st
+        hi = bisect.bisect_left(starts, en)     # a partir de hi, todo turno começa em/após en
+
         best_spk = None
         best_ov = 0.0
-        for ts, te, spk in turns:
-            ov = overlap(st, en, ts, te)
-            if ov > best_ov:
-                best_ov = ov
-                best_spk = spk
+        best_k = -1
+        per_spk: Dict[str, float] = {}
+        ov_sum = 0.0
+        for ts, te, spk, k in turns[lo:hi]:
+            ov = min(en, te) - max(st, ts)
+            if ov <= 0.0:
+                continue
+            ov_sum += ov
+            per_spk[spk] = per_spk.get(spk, 0.0) + ov
+            # empate: vence o turno que vem primeiro no annotation (mesma regra da varredura completa)
+            if ov > best_ov or (ov == best_ov and k < best_k):
+                best_ov, best_spk, best_k = ov, spk, k
 
         seg2 = dict(seg)
         if best_spk is not None and best_ov > 0.0:
-            seg2["speaker"] = normalize_label(best_spk)
+            seg2["speaker"] = _normalize_speaker_label(best_spk)
             seg2["speaker_ov"] = round(float(best_ov), 4)
             seg2["speaker_ov_share"] = round(float(best_ov / dur) if dur > 0 else 0.0, 4)
         else:
             seg2["speaker_ov"] = 0.0
             seg2["speaker_ov_share"] = 0.0
+
+        if len(per_spk) > 1:
+            merged: Dict[str, float] = {}
+            for spk, ov in per_spk.items():
+                lab = _normalize_speaker_label(spk)
+                merged[lab] = merged.get(lab, 0.0) + ov
+            seg2["speaker_overlaps"] = {lab: round(float(ov), 4) for lab, ov in merged.items()}
+            multi_speaker += 1
+        if ov_sum > dur + 1e-6:
+            seg2["overlap_speech"] = True
+            overlap_speech += 1
+
+        seg_total += dur
+        ov_total += float(seg2["speaker_ov"])
         enriched.append(seg2)
 
-    return enriched
+    stats = {
+        "turns": len(turns),
+        "coverage": (ov_total / seg_total) if seg_total > 0 else 0.0,
+        "speaker_durations": spk_dur,
+        "multi_speaker_segments": multi_speaker,
+        "overlap_speech_segments": overlap_speech,
+    }
+    return enriched, stats
 
 
 def _speaker_to_role(speaker: str) -> str:
@@ -822,6 +2253,13 @@ class RolePatterns:
         self.vendor_txt: List[Tuple[int, str]] = []
         self.client_re: List[Tuple[int, Any]] = []
         self.client_txt: List[Tuple[int, str]] = []
+        self._matcher: Optional["_RoleMatcher"] = None
+
+    def matcher(self) -> "_RoleMatcher":
+        """Matcher compilado (montado uma vez, na primeira segmentação por texto)."""
+        if self._matcher is None:
+            self._matcher = _RoleMatcher(self)
+        return self._matcher
 
 def _safe_compile_regex(pat: str) -> Optional[Any]:
     try:
@@ -904,6 +2342,7 @@ def load_role_patterns(vendor_path: str, client_path: str) -> Tuple[RolePatterns
 def _fuzzy_score(a: str, b: str) -> int:
     if not a or not b:
         return 0
+    _rfuzz, fuzz = _fuzz_backends()
     if _rfuzz is not None:
         try:
             return int(_rfuzz.token_set_ratio(a, b))
@@ -917,6 +2356,237 @@ def _fuzzy_score(a: str, b: str) -> int:
     return 0
 
 
+# Padrões que não podem ir para o scanner combinado (referências, inclusive condicionais (?(1)...),
+# grupos nomeados, flags inline): os grupos externos do scanner renumerariam as referências
+_RE_NOT_COMBINABLE = re.compile(r"\\[1-9]|\(\?P[<=]|\(\?\(|\(\?[aiLmsux]+\)")
+_FW_ASCII_DROP = dict.fromkeys(range(128, 256))
+
+
+def _anchored_at_start(pat: str) -> bool:
+    """True se o padrão só pode casar na posição 0 (começa com ^ e não tem | no nível de topo)."""
+    if not pat.startswith("^"):
+        return False
+    depth = 0
+    in_class = False
+    i = 1
+    while i < len(pat):
+        ch = pat[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = ch != "]"
+        elif ch == "[":
+            in_class = True
+            if pat[i + 1:i + 2] == "^":
+                i += 1
+            if pat[i + 1:i + 2] == "]":
+                i += 1
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return False
+        i += 1
+    return True
+
+
+def _fuzzy_tokens(s: str, backend: str) -> List[str]:
+    # tokenização de token_set_ratio em cada backend (fuzzywuzzy aplica full_process com force_ascii)
+    if backend == "fuzzywuzzy":
+        s = re.sub(r"(?ui)\W", " ", s.translate(_FW_ASCII_DROP)).lower().strip()
+    return s.split()
+
+
+class _RoleMatcher:
+    """
+    Versão compilada de RolePatterns para role_by_text:
+      - regex: um scanner por lado; cada padrão vira um lookahead opcional com grupo
+        próprio (direto quando ancorado em ^, precedido de um prefixo preguiçoso caso
+        contrário), todos avaliados num único match; o grupo casado indica o peso.
+        Padrões não combináveis ficam no caminho individual;
+      - txt: uma alternância única (mais longos primeiro) percorrida por finditer faz o papel
+        do autômato de substrings; padrões que são prefixo de um casado na mesma posição
+        são marcados junto;
+      - fuzzy: só entram pares (segmento, padrão txt) que dividem algum token ou cujo
+        comprimento ainda permite atingir o threshold (sem token em comum o score é limitado
+        por 200*min/(la+lb)); com rapidfuzz, as linhas com candidatos vão numa única
+        process.cdist por arquivo; com fuzzywuzzy, token_set_ratio só nos candidatos;
+      - textos repetidos dentro do arquivo são pontuados uma vez.
+    Os pesos de regex são inteiros (soma exata em qualquer ordem) e os de txt/fuzzy somam na
+    ordem do laço original, então os scores são idênticos aos da varredura padrão a padrão.
+    """
+
+    def __init__(self, rp: RolePatterns):
+        self.vendor_re = self._build_re_scanner(rp.vendor_re)
+        self.client_re = self._build_re_scanner(rp.client_re)
+
+        self.txt_entries: List[Tuple[str, int, str]] = (
+            [("v", w, pat) for w, pat in rp.vendor_txt] + [("c", w, pat) for w, pat in rp.client_txt]
+        )
+        uniq = sorted({pat for _, _, pat in self.txt_entries if pat}, key=len, reverse=True)
+        self.txt_scanner = (
+            re.compile("(?=(" + "|".join(re.escape(p) for p in uniq) + "))") if uniq else None
+        )
+        self.txt_prefixes: Dict[str, List[str]] = {
+            p: [q for q in uniq if q != p and p.startswith(q)] for p in uniq
+        }
+        self.txt_by_pat: Dict[str, List[int]] = {}
+        for k, (_, _, pat) in enumerate(self.txt_entries):
+            if pat:
+                self.txt_by_pat.setdefault(pat, []).append(k)
+        self._fuzzy_index: Dict[str, Tuple[Dict[str, List[int]], List[int]]] = {}
+
+    @staticmethod
+    def _build_re_scanner(items: List[Tuple[int, Any]]) -> Tuple[Optional[Any], List[Tuple[int, int]], List[Tuple[int, Any]]]:
+        """(regex combinado, [(peso, grupo)], [(peso, regex individual)])."""
+        bodies: List[Tuple[int, str]] = []
+        single: List[Tuple[int, Any]] = []
+        for w, cre in items:
+            pat = getattr(cre, "pattern", None)
+            if not isinstance(pat, str) or _RE_NOT_COMBINABLE.search(pat):
+                single.append((w, cre))
+                continue
+            bodies.append((w, pat if _anchored_at_start(pat) else r"[\s\S]*?(?:" + pat + ")"))
+
+        if not bodies:
+            return None, [], single
+        try:
+            scanner = re.compile("".join(f"(?:(?=({b}))|)" for _, b in bodies), flags=re.IGNORECASE)
+            # grupo de cada padrão = grupo externo do seu lookahead (grupos internos deslocam a numeração)
+            groups: List[Tuple[int, int]] = []
+            g = 1
+            for w, b in bodies:
+                groups.append((w, g))
+                g += 1 + re.compile(b, flags=re.IGNORECASE).groups
+        except Exception:
+            return None, [], list(items)
+        return scanner, groups, single
+
+    @staticmethod
+    def _re_score(scanner_spec: Tuple[Optional[Any], List[Tuple[int, int]], List[Tuple[int, Any]]], text: str) -> float:
+        scanner, groups, single = scanner_spec
+        total = 0
+        if scanner is not None:
+            try:
+                m = scanner.match(text)
+                if m is not None:
+                    regs = m.regs
+                    total += sum(w for w, g in groups if regs[g][0] >= 0)
+            except Exception:
+                pass
+        for w, cre in single:
+            try:
+                if cre.search(text):
+                    total += w
+            except Exception:
+                pass
+        return float(total)
+
+    def _txt_hits(self, norm: str) -> set:
+        found = set()
+        if self.txt_scanner is None:
+            return found
+        for m in self.txt_scanner.finditer(norm):
+            p = m.group(1)
+            if p not in found:
+                found.add(p)
+                found.update(self.txt_prefixes.get(p, ()))
+        return found
+
+    def _fuzzy_candidates(self, norm: str, backend: str, threshold: int) -> set:
+        idx = self._fuzzy_index.get(backend)
+        if idx is None:
+            inv: Dict[str, List[int]] = {}
+            lens: List[int] = []
+            for k, (_, _, pat) in enumerate(self.txt_entries):
+                toks = sorted(set(_fuzzy_tokens(pat, backend)))
+                for t in toks:
+                    inv.setdefault(t, []).append(k)
+                lens.append(len(" ".join(toks)))
+            idx = (inv, lens)
+            self._fuzzy_index[backend] = idx
+        inv, lens = idx
+
+        toks = sorted(set(_fuzzy_tokens(norm, backend)))
+        cands = set()
+        for t in toks:
+            cands.update(inv.get(t, ()))
+        la = len(" ".join(toks))
+        for k, lb in enumerate(lens):
+            if k not in cands and la + lb > 0 and 200.0 * min(la, lb) / (la + lb) >= threshold - 0.5:
+                cands.add(k)
+        return cands
+
+    def _fuzzy_matrix(self, norms: List[str], threshold: int) -> Optional[Any]:
+        # rapidfuzz: os segmentos recebidos contra todos os padrões txt numa única chamada em C
+        _rfuzz, _ = _fuzz_backends()
+        if _rfuzz is None or not self.txt_entries or not norms:
+            return None
+        try:
+            from rapidfuzz import process as _rprocess  # type: ignore
+
+            return _rprocess.cdist(
+                norms,
+                [pat for _, _, pat in self.txt_entries],
+                scorer=_rfuzz.token_set_ratio,
+                score_cutoff=threshold,
+                dtype=np.uint8,
+            )
+        except Exception:
+            return None
+
+    def scores_many(
+        self, texts: List[str], norms: List[str], fuzzy_threshold: int, fuzzy_backend: Optional[str]
+    ) -> List[Tuple[float, float]]:
+        # textos repetidos (respostas curtas, "sim", "ok"...) são pontuados uma vez só
+        uniq: Dict[Tuple[str, str], int] = {}
+        keys = [uniq.setdefault((t, n), len(uniq)) for t, n in zip(texts, norms)]
+        u_texts = [t for t, _ in uniq]
+        u_norms = [n for _, n in uniq]
+
+        # linhas sem nenhum candidato fuzzy (sem token em comum e comprimento incompatível) ficam fora
+        cands = [self._fuzzy_candidates(n, fuzzy_backend, fuzzy_threshold) if (fuzzy_backend and n) else set() for n in u_norms]
+        fuzzy_rows: Dict[int, set] = {}
+        if fuzzy_backend == "rapidfuzz":
+            rows = [u for u, c in enumerate(cands) if c]
+            fmat = self._fuzzy_matrix([u_norms[u] for u in rows], fuzzy_threshold) if rows else None
+            if fmat is not None:
+                for r, u in enumerate(rows):
+                    fuzzy_rows[u] = set(np.flatnonzero(fmat[r] >= fuzzy_threshold).tolist())
+
+        u_scores: List[Tuple[float, float]] = []
+        for u, (text, norm) in enumerate(zip(u_texts, u_norms)):
+            v_score = self._re_score(self.vendor_re, text)
+            c_score = self._re_score(self.client_re, text)
+
+            # entradas txt com acerto exato (peso cheio) ou fuzzy (peso reduzido), na ordem original
+            exact = set()
+            for pat in self._txt_hits(norm):
+                exact.update(self.txt_by_pat.get(pat, ()))
+            if u in fuzzy_rows:
+                fuzzy = fuzzy_rows[u]
+            elif fuzzy_backend:
+                # fuzzywuzzy (ou cdist indisponível): par a par, só nos candidatos
+                fuzzy = {
+                    k for k in cands[u]
+                    if k not in exact and _fuzzy_score(norm, self.txt_entries[k][2]) >= fuzzy_threshold
+                }
+            else:
+                fuzzy = set()
+
+            for k in sorted(exact | fuzzy):
+                side, w, _ = self.txt_entries[k]
+                add = float(w) if k in exact else float(w) * FUZZY_WEIGHT_FACTOR
+                if side == "v":
+                    v_score += add
+                else:
+                    c_score += add
+            u_scores.append((v_score, c_score))
+        return [u_scores[k] for k in keys]
+
+
 # =============================================================================
 # Qualidade diarização
 # =============================================================================
@@ -925,7 +2595,9 @@ def assess_diarization_quality(
     assigned_segments: List[Dict[str, Any]],
     collapse_max_share: float = DIAR_COLLAPSE_MAX_SHARE,
     min_coverage: float = DIAR_MIN_COVERAGE,
+    assign_stats: Optional[Dict[str, Any]] = None,
 ) -> Tuple[bool, Dict[str, Any]]:
+    """assign_stats (de _assign_speakers_to_segments) evita reiterar o annotation e os segmentos."""
     info: Dict[str, Any] = {
         "speakers": 0,
         "collapsed": False,
@@ -940,17 +2612,21 @@ def assess_diarization_quality(
 
     spk_dur: Dict[str, float] = {}
     total_dur = 0.0
-    try:
-        for seg, _, lab in ann.itertracks(yield_label=True):
-            st = float(getattr(seg, "start", 0.0))
-            en = float(getattr(seg, "end", st))
-            dur = max(0.0, en - st)
-            total_dur += dur
-            key = str(lab)
-            spk_dur[key] = spk_dur.get(key, 0.0) + dur
-    except Exception:
-        info["ok"] = False
-        return False, info
+    if assign_stats is not None and "speaker_durations" in assign_stats:
+        spk_dur = dict(assign_stats["speaker_durations"])
+        total_dur = sum(spk_dur.values())
+    else:
+        try:
+            for seg, _, lab in ann.itertracks(yield_label=True):
+                st = float(getattr(seg, "start", 0.0))
+                en = float(getattr(seg, "end", st))
+                dur = max(0.0, en - st)
+                total_dur += dur
+                key = str(lab)
+                spk_dur[key] = spk_dur.get(key, 0.0) + dur
+        except Exception:
+            info["ok"] = False
+            return False, info
 
     n_speakers = len([k for k, v in spk_dur.items() if v > 0.01])
     info["speakers"] = int(n_speakers)
@@ -967,15 +2643,17 @@ def assess_diarization_quality(
         return False, info
 
     if assigned_segments:
-        seg_total = 0.0
-        ov_total = 0.0
-        for s in assigned_segments:
-            st = float(s.get("start", 0.0))
-            en = float(s.get("end", st))
-            seg_total += max(0.0, en - st)
-            ov_total += float(s.get("speaker_ov", 0.0) or 0.0)
-
-        cov = (ov_total / seg_total) if seg_total > 0 else 0.0
+        if assign_stats is not None and "coverage" in assign_stats:
+            cov = float(assign_stats["coverage"])
+        else:
+            seg_total = 0.0
+            ov_total = 0.0
+            for s in assigned_segments:
+                st = float(s.get("start", 0.0))
+                en = float(s.get("end", st))
+                seg_total += max(0.0, en - st)
+                ov_total += float(s.get("speaker_ov", 0.0) or 0.0)
+            cov = (ov_total / seg_total) if seg_total > 0 else 0.0
         info["coverage"] = float(cov)
 
         if cov < min_coverage:
@@ -1008,8 +2686,105 @@ def _short_client_like(text: str) -> bool:
             return True
     return False
 
-def _confidence_from_diff(diff: float) -> float:
-    return float(min(1.0, abs(diff) / float(CONF_NORM)))
+_CONDUCAO_RE = re.compile(
+    r"\b(agradeç|agradeco|obrigad|prometo|podemos\s+agendar|vamos\s+agendar|fico\s+à\s+disposi|estou\s+à\s+disposi)\b"
+)
+
+
+@dataclass
+class RoleColumns:
+    """Features e papéis de todos os segmentos de um arquivo, em colunas (um valor por segmento)."""
+    question: np.ndarray      # _is_question_like
+    short: np.ndarray         # _short_client_like
+    n_words: np.ndarray       # _count_words
+    vendor_score: np.ndarray
+    client_score: np.ndarray
+    conf: np.ndarray          # confiança sem arredondamento
+    vendor: np.ndarray        # True = VENDEDOR
+
+
+def _text_features(texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # calculadas uma vez por arquivo e reaproveitadas no scoring e no smoothing
+    question = np.fromiter((_is_question_like(t) for t in texts), dtype=bool, count=len(texts))
+    short = np.fromiter((_short_client_like(t) for t in texts), dtype=bool, count=len(texts))
+    n_words = np.fromiter((_count_words(t) for t in texts), dtype=np.int64, count=len(texts))
+    return question, short, n_words
+
+
+def _alternating_chain(cand: np.ndarray) -> np.ndarray:
+    """
+    fired[i] = cand[i] and not fired[i-1], sem laço: numa sequência de candidatos
+    consecutivos disparam as posições 0, 2, 4... contadas a partir do início da sequência.
+    """
+    n = len(cand)
+    if n == 0:
+        return cand.copy()
+    idx = np.arange(n)
+    starts = cand & ~np.concatenate(([False], cand[:-1]))
+    run_start = np.maximum.accumulate(np.where(starts, idx, 0))
+    return cand & ((idx - run_start) % 2 == 0)
+
+
+def role_columns(
+    segments: List[Dict[str, Any]],
+    patterns: RolePatterns,
+    fuzzy_threshold: int = FUZZY_THRESHOLD,
+    strong_min: float = ROLE_STRONG_MIN,
+) -> Tuple[RoleColumns, bool]:
+    """
+    Scoring de role_by_text em colunas NumPy. O bônus "resposta curta logo após pergunta
+    forte do vendedor" depende do papel do segmento anterior; ele é resolvido por ponto
+    fixo (cada iteração fixa pelo menos mais um segmento do prefixo; em geral 1-2 iterações).
+    """
+    _rfuzz, fuzz = _fuzz_backends()
+    fuzzy_used = (_rfuzz is not None) or (fuzz is not None)
+    fuzzy_backend = ("rapidfuzz" if _rfuzz is not None else "fuzzywuzzy") if fuzzy_used else None
+
+    texts = [(seg.get("text") or "").strip() for seg in segments]
+    norms = [_normalize_text_basic(text) for text in texts]
+    scores = patterns.matcher().scores_many(texts, norms, fuzzy_threshold, fuzzy_backend)
+    question, short, n_words = _text_features(texts)
+    conducao = np.fromiter((_CONDUCAO_RE.search(n) is not None for n in norms), dtype=bool, count=len(norms))
+
+    v_base = np.array([v for v, _ in scores], dtype=np.float64).reshape(-1)
+    c_base = np.array([c for _, c in scores], dtype=np.float64).reshape(-1)
+
+    # mesma ordem de somas do laço original: base, +2 pergunta, +3 condução / base, +2 pós-pergunta, +2 curta
+    v = np.where(question, v_base + 2.0, v_base)
+    v = np.where(conducao, v + 3.0, v)
+
+    prev_vq = np.zeros(len(texts), dtype=bool)
+    for _ in range(len(texts) + 1):
+        c = np.where(prev_vq & short, c_base + 2.0, c_base)
+        c = np.where(short, c + 2.0, c)
+        diff = v - c
+        conf = np.minimum(1.0, np.abs(diff) / float(CONF_NORM))
+        vendor = diff >= 0  # regra: empate vai para vendedor
+        strong_q = vendor & question & (conf >= strong_min)
+        nxt = np.concatenate(([False], strong_q[:-1]))
+        if np.array_equal(nxt, prev_vq):
+            break
+        prev_vq = nxt
+
+    cols = RoleColumns(
+        question=question, short=short, n_words=n_words,
+        vendor_score=v, client_score=c, conf=conf, vendor=vendor,
+    )
+    return cols, fuzzy_used
+
+
+def _role_stats(conf_r: List[float], vendor: np.ndarray, fuzzy_used: bool) -> Dict[str, Any]:
+    n = len(conf_r)
+    v_n = int(np.count_nonzero(vendor))
+    mean_conf = float(sum(conf_r) / max(1, n))
+    return {
+        "segments": n,
+        "mean_conf": round(mean_conf, 3),
+        "vendor_pct": round(100.0 * v_n / max(1, n), 1),
+        "client_pct": round(100.0 * (n - v_n) / max(1, n), 1),
+        "fuzzy_used": bool(fuzzy_used),
+    }
+
 
 def role_by_text(
     segments: List[Dict[str, Any]],
@@ -1020,142 +2795,155 @@ def role_by_text(
     if not segments:
         return [], {"segments": 0, "mean_conf": 0.0, "vendor_pct": 0.0, "client_pct": 0.0, "fuzzy_used": False}
 
-    fuzzy_used = (_rfuzz is not None) or (fuzz is not None)
-    out: List[Dict[str, Any]] = []
-    prev_was_vendor_q = False
+    cols, fuzzy_used = role_columns(segments, patterns, fuzzy_threshold, strong_min)
+    conf_r = [round(float(x), 3) for x in cols.conf.tolist()]
+    out = _role_dicts(segments, cols.vendor_score, cols.client_score, conf_r, cols.vendor)
+    return out, _role_stats(conf_r, cols.vendor, fuzzy_used)
 
-    for seg in segments:
-        text = (seg.get("text") or "").strip()
-        norm = _normalize_text_basic(text)
 
-        v_score = 0.0
-        c_score = 0.0
+def _role_dicts(
+    segments: List[Dict[str, Any]],
+    vendor_score: np.ndarray,
+    client_score: np.ndarray,
+    conf_r: List[float],
+    vendor: np.ndarray,
+) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for seg, vs, cs, cf, is_v in zip(segments, vendor_score.tolist(), client_score.tolist(), conf_r, vendor.tolist()):
+        seg2 = dict(seg)
+        seg2["role_method"] = "role_by_text"
+        seg2["vendor_score"] = round(float(vs), 3)
+        seg2["client_score"] = round(float(cs), 3)
+        seg2["role_conf"] = cf
+        seg2["role"] = "VENDEDOR" if is_v else "CLIENTE"
+        out.append(seg2)
+    return out
 
-        for w, cre in patterns.vendor_re:
-            try:
-                if cre.search(text):
-                    v_score += float(w)
-            except Exception:
-                pass
 
-        for w, cre in patterns.client_re:
-            try:
-                if cre.search(text):
-                    c_score += float(w)
-            except Exception:
-                pass
+# =============================================================================
+# Smoothing
+# =============================================================================
+def _smooth_columns(
+    role: np.ndarray,
+    conf_r: List[float],
+    question: np.ndarray,
+    short: np.ndarray,
+    n_words: np.ndarray,
+    vendor_code: int,
+    client_code: int,
+    strong_min: float = ROLE_STRONG_MIN,
+) -> Tuple[np.ndarray, List[float], Dict[str, Any]]:
+    """
+    smooth_roles sobre colunas. role: códigos inteiros; conf_r: role_conf já arredondada.
+    Os dois passes do laço original são encadeados (uma correção impede a seguinte), o que
+    vira _alternating_chain sobre as condições calculadas de uma vez.
+    """
+    n = len(conf_r)
+    role = role.copy()
+    conf_r = list(conf_r)
+    postq_fixed = 0
+    islands_fixed = 0
 
-        for w, pat in patterns.vendor_txt:
-            if pat and pat in norm:
-                v_score += float(w)
-            else:
-                if fuzzy_used and pat:
-                    sc = _fuzzy_score(norm, pat)
-                    if sc >= fuzzy_threshold:
-                        v_score += float(w) * FUZZY_WEIGHT_FACTOR
-
-        for w, pat in patterns.client_txt:
-            if pat and pat in norm:
-                c_score += float(w)
-            else:
-                if fuzzy_used and pat:
-                    sc = _fuzzy_score(norm, pat)
-                    if sc >= fuzzy_threshold:
-                        c_score += float(w) * FUZZY_WEIGHT_FACTOR
+    if n >= 2:
+        conf = np.asarray(conf_r, dtype=np.float64)
+        # pós-pergunta: pergunta forte do vendedor em i torna i+1 CLIENTE se for resposta curta
+        cand = np.zeros(n, dtype=bool)
+        cand[:-1] = (
+            (role[:-1] == vendor_code) & (conf[:-1] >= strong_min) & question[:-1]
+            & (n_words[1:] <= 10) & short[1:] & (role[1:] != client_code)
+        )
+        fired = _alternating_chain(cand)
+        for i in np.flatnonzero(fired).tolist():
+            role[i + 1] = client_code
+            conf_r[i + 1] = round(max(conf_r[i + 1], 0.75), 3)
+        postq_fixed = int(np.count_nonzero(fired))
+
+    if n >= 3:
+        conf = np.asarray(conf_r, dtype=np.float64)
+        # ilhas: segmento fraco entre dois vizinhos de mesmo papel assume o papel deles
+        cand = np.zeros(n, dtype=bool)
+        cand[1:-1] = (role[:-2] == role[2:]) & (role[1:-1] != role[:-2]) & (conf[1:-1] < strong_min) & (ISLAND_MAX_LEN >= 1)
+        fired = _alternating_chain(cand)
+        for i in np.flatnonzero(fired).tolist():
+            role[i] = role[i - 1]
+            conf_r[i] = round(max(conf_r[i], 0.70), 3)
+        islands_fixed = int(np.count_nonzero(fired))
+
+    stats = {"changed": postq_fixed + islands_fixed, "islands_fixed": islands_fixed, "postq_fixed": postq_fixed}
+    return role, conf_r, stats
 
-        # heurísticas leves
-        if _is_question_like(text):
-            v_score += 2.0
 
-        # APERTO: só puxa para cliente se for resposta curta, não qualquer frase
-        if prev_was_vendor_q and _short_client_like(text):
-            c_score += 2.0
+def smooth_roles(segments: List[Dict[str, Any]], strong_min: float = ROLE_STRONG_MIN) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    if not segments:
+        return [], {"changed": 0, "islands_fixed": 0, "postq_fixed": 0}
 
-        if _short_client_like(text):
-            c_score += 2.0
+    segs = [dict(s) for s in segments]
+    codes: Dict[str, int] = {"VENDEDOR": 0, "CLIENTE": 1}
+    names = ["VENDEDOR", "CLIENTE"]
+    role_list: List[int] = []
+    for sg in segs:
+        r = str(sg.get("role") or "VENDEDOR")
+        if r not in codes:
+            codes[r] = len(names)
+            names.append(r)
+        role_list.append(codes[r])
+
+    conf_r: List[float] = []
+    for sg in segs:
+        try:
+            conf_r.append(float(sg.get("role_conf") or 0.0))
+        except Exception:
+            conf_r.append(0.0)
 
-        # NOVO: frases de condução/agradecimento tendem a ser do vendedor
-        if re.search(r"\b(agradeç|agradeco|obrigad|prometo|podemos\s+agendar|vamos\s+agendar|fico\s+à\s+disposi|estou\s+à\s+disposi)\b", norm):
-            v_score += 3.0
+    question, short, n_words = _text_features([str(sg.get("text") or "") for sg in segs])
+    role_old = np.asarray(role_list, dtype=np.int64)
+    role_new, conf_new, stats = _smooth_columns(role_old, conf_r, question, short, n_words, 0, 1, strong_min)
 
-        diff = v_score - c_score
-        conf = _confidence_from_diff(diff)
+    for i in np.flatnonzero((role_new != role_old) | (np.asarray(conf_new) != np.asarray(conf_r))).tolist():
+        segs[i]["role"] = names[int(role_new[i])]
+        segs[i]["role_conf"] = conf_new[i]
+    return segs, stats
 
-        # regra: empate vai para vendedor
-        role = "VENDEDOR" if diff >= 0 else "CLIENTE"
 
-        seg2 = dict(seg)
-        seg2["role_method"] = "role_by_text"
-        seg2["vendor_score"] = round(float(v_score), 3)
-        seg2["client_score"] = round(float(c_score), 3)
-        seg2["role_conf"] = round(float(conf), 3)
-        seg2["role"] = role
-        out.append(seg2)
+def role_by_text_smoothed(
+    segments: List[Dict[str, Any]],
+    patterns: RolePatterns,
+    fuzzy_threshold: int = FUZZY_THRESHOLD,
+    strong_min: float = ROLE_STRONG_MIN,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Dict[str, Any]]:
+    """
+    role_by_text + smooth_roles num caminho só: features calculadas uma vez, papéis e
+    smoothing sobre colunas e um único dict por segmento no final (mesmo schema de saída).
+    """
+    if not segments:
+        return [], role_by_text([], patterns)[1], smooth_roles([])[1]
 
-        prev_was_vendor_q = (role == "VENDEDOR") and _is_question_like(text) and (conf >= strong_min)
+    cols, fuzzy_used = role_columns(segments, patterns, fuzzy_threshold, strong_min)
+    conf_r = [round(float(x), 3) for x in cols.conf.tolist()]
+    role_stats = _role_stats(conf_r, cols.vendor, fuzzy_used)
 
-    mean_conf = float(sum(float(s.get("role_conf", 0.0)) for s in out) / max(1, len(out)))
-    v_n = sum(1 for s in out if s.get("role") == "VENDEDOR")
-    c_n = len(out) - v_n
-    stats = {
-        "segments": len(out),
-        "mean_conf": round(mean_conf, 3),
-        "vendor_pct": round(100.0 * v_n / max(1, len(out)), 1),
-        "client_pct": round(100.0 * c_n / max(1, len(out)), 1),
-        "fuzzy_used": bool(fuzzy_used),
-    }
-    return out, stats
+    role = np.where(cols.vendor, 0, 1).astype(np.int64)
+    role_s, conf_s, smooth_stats = _smooth_columns(role, conf_r, cols.question, cols.short, cols.n_words, 0, 1, strong_min)
+    out = _role_dicts(segments, cols.vendor_score, cols.client_score, conf_s, role_s == 0)
+    return out, role_stats, smooth_stats
 
 
 # =============================================================================
-# Smoothing
+# TXT builder
 # =============================================================================
-def smooth_roles(segments: List[Dict[str, Any]], strong_min: float = ROLE_STRONG_MIN) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
-    if not segments:
-        return [], {"changed": 0, "islands_fixed": 0, "postq_fixed": 0}
-
-    segs = [dict(s) for s in segments]
-    changed = 0
-    islands_fixed = 0
-    postq_fixed = 0
+def _segment_txt_role(seg: Dict[str, Any], diarization_mode: str) -> str:
+    """Papel final do segmento (o que vai para o TXT)."""
+    if diarization_mode == "pyannote_ok":
+        speaker = str(seg.get("speaker") or "")
+        role = _speaker_to_role(speaker)
+    elif diarization_mode in {"pyannote_failed_role_by_text", "no_token_role_by_text"}:
+        role = str(seg.get("role") or "VENDEDOR")
+    else:
+        role = "VENDEDOR"
 
-    def _get_role(i: int) -> str:
-        return str(segs[i].get("role") or "VENDEDOR")
-
-    def _get_conf(i: int) -> float:
-        try:
-            return float(segs[i].get("role_conf") or 0.0)
-        except Exception:
-            return 0.0
-
-    for i in range(len(segs) - 1):
-        t_i = str(segs[i].get("text") or "")
-        if _get_role(i) == "VENDEDOR" and _get_conf(i) >= strong_min and _is_question_like(t_i):
-            t_next = str(segs[i + 1].get("text") or "")
-            if _count_words(t_next) <= 10 and _short_client_like(t_next):
-                if _get_role(i + 1) != "CLIENTE":
-                    segs[i + 1]["role"] = "CLIENTE"
-                    segs[i + 1]["role_conf"] = round(max(_get_conf(i + 1), 0.75), 3)
-                    changed += 1
-                    postq_fixed += 1
-
-    for i in range(1, len(segs) - 1):
-        r_prev = _get_role(i - 1)
-        r_cur = _get_role(i)
-        r_next = _get_role(i + 1)
-        if r_prev == r_next and r_cur != r_prev:
-            if _get_conf(i) < strong_min and ISLAND_MAX_LEN >= 1:
-                segs[i]["role"] = r_prev
-                segs[i]["role_conf"] = round(max(_get_conf(i), 0.70), 3)
-                changed += 1
-                islands_fixed += 1
-
-    return segs, {"changed": changed, "islands_fixed": islands_fixed, "postq_fixed": postq_fixed}
+    return "VENDEDOR" if role != "CLIENTE" else "CLIENTE"
 
 
-# =============================================================================
-# TXT builder
-# =============================================================================
 def _build_txt(segments: List[Dict[str, Any]], diarization_mode: str) -> str:
     lines: List[str] = []
     for seg in segments:
@@ -1163,28 +2951,83 @@ def _build_txt(segments: List[Dict[str, Any]], diarization_mode: str) -> str:
         if not text:
             continue
 
-        if diarization_mode == "pyannote_ok":
-            speaker = str(seg.get("speaker") or "")
-            role = _speaker_to_role(speaker)
-        elif diarization_mode in {"pyannote_failed_role_by_text", "no_token_role_by_text"}:
-            role = str(seg.get("role") or "VENDEDOR")
-        else:
-            role = "VENDEDOR"
-
-        role = "VENDEDOR" if role != "CLIENTE" else "CLIENTE"
+        role = _segment_txt_role(seg, diarization_mode)
         lines.append(f"[{role}] {text}")
 
     return "\n".join(lines) + ("\n" if lines else "")
 
 def _write_text(path: Path, content: str) -> None:
+    # arquivo temporário + os.replace: quem lê a saída nunca vê um arquivo pela metade
     _ensure_dir(path.parent)
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            try:
+                tmp.unlink()
+            except Exception:
+                pass
 
-def _write_json(path: Path, obj: Dict[str, Any]) -> None:
-    _ensure_dir(path.parent)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+def _json_text(obj: Dict[str, Any]) -> str:
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+# ------------------------------
+# Formatos compactos do JSON (--json_format)
+# ------------------------------
+# json:     o objeto completo, indentado (default)
+# jsonl:    1ª linha = cabeçalho (metadata, diarization, errors); depois um segmento por linha
+# columnar: 1ª linha = cabeçalho; depois uma linha por coluna {"column": nome, "values": [...]}
+# Nos dois compactos cada segmento começa por start/end/role/text, com role = papel final do TXT.
+JSON_FORMATS = ("json", "jsonl", "columnar")
+_JSON_FORMAT_SUFFIX = {"json": ".json", "jsonl": ".jsonl", "columnar": ".columns.jsonl"}
+
+
+def _compact_dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _compact_segments(json_obj: Dict[str, Any]) -> List[Dict[str, Any]]:
+    mode = str(json_obj.get("diarization") or "")
+    out: List[Dict[str, Any]] = []
+    for seg in json_obj.get("segments") or []:
+        row: Dict[str, Any] = {
+            "start": seg.get("start"),
+            "end": seg.get("end"),
+            "role": _segment_txt_role(seg, mode),
+            "text": seg.get("text", ""),
+        }
+        for k, v in seg.items():
+            if k not in row:
+                row[k] = v
+        out.append(row)
+    return out
+
+
+def _json_output_text(json_obj: Dict[str, Any], json_format: str = "json") -> str:
+    if json_format not in ("jsonl", "columnar"):
+        return _json_text(json_obj)
+
+    segments = _compact_segments(json_obj)
+    header = {k: v for k, v in json_obj.items() if k != "segments"}
+    header["format"] = json_format
+    header["n_segments"] = len(segments)
+    lines = [_compact_dumps(header)]
+
+    if json_format == "jsonl":
+        lines.extend(_compact_dumps(seg) for seg in segments)
+    else:
+        columns: Dict[str, None] = {}
+        for seg in segments:
+            for k in seg:
+                columns.setdefault(k, None)
+        for col in columns:
+            lines.append(_compact_dumps({"column": col, "values": [seg.get(col) for seg in segments]}))
+
+    return "\n".join(lines) + "\n"
 
 
 # =============================================================================
@@ -1255,6 +3098,1298 @@ def _archive_audio(audio_path: Path, cache_dir: Path, audio_hash: str) -> Option
             return None
 
 
+# =============================================================================
+# Processamento por arquivo (compartilhado entre modo sequencial e workers)
+# =============================================================================
+@dataclass
+class RunContext:
+    asr_params: ASRParams
+    hf_token: str
+    dicionario: Dict[str, str]
+    role_patterns: RolePatterns
+    role_pat_stats: Dict[str, Any]
+    dict_path: str
+    roles_vendor_path: str
+    roles_client_path: str
+    diar_parallel: bool = True
+    corretor: Optional[DictionaryCorrector] = None
+    punctuation: bool = True
+    punct_batch_size: int = PUNCT_BATCH_SIZE
+    # cache por etapa: leitura nas etapas (threads/workers), escrita em _finalize_job
+    cache_db_path: str = ""
+    stage_cache: bool = True
+    post_hash: str = ""
+    json_format: str = "json"
+    partial_dir: str = ""
+    workers: int = 1
+    # perfil de ASR (--profile): "manual" = --model/--beam_size; "auto" = parâmetros por arquivo (FileJob.asr_params)
+    profile: str = "manual"
+    # linhas do resumo da execução (uma por arquivo finalizado; só no processo principal)
+    summary_rows: List[Dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass
+class FileJob:
+    idx: int
+    total: int
+    audio_path: Path
+    audio_hash: str = ""
+    cache_key: str = ""
+    duration_s: Optional[float] = None
+    errors: List[Dict[str, str]] = field(default_factory=list)
+    asr_segments_raw: List[Dict[str, Any]] = field(default_factory=list)
+    asr_segments: List[Dict[str, Any]] = field(default_factory=list)
+    segments_final: List[Dict[str, Any]] = field(default_factory=list)
+    diarization_mode: str = "fallback_all_vendor"
+    total_corrigidas: int = 0
+    punctuated: bool = False
+    merge_stats: Dict[str, Any] = field(default_factory=lambda: {"merges": 0, "in": 0, "out": 0})
+    split_stats: Dict[str, Any] = field(default_factory=lambda: {"changed": 0, "in": 0, "out": 0})
+    role_stats: Dict[str, Any] = field(default_factory=dict)
+    smooth_stats: Dict[str, Any] = field(default_factory=dict)
+    diar_quality: Dict[str, Any] = field(default_factory=dict)
+    t0: float = 0.0
+    # áudio decodificado no início do ASR; liberado ao fim de _stage_roles (não volta dos workers)
+    audio: Optional[DecodedAudio] = None
+    audio_info: Dict[str, Any] = field(default_factory=dict)
+    # diarização disparada em paralelo ao ASR: (thread, resultado, erros); consumida em _stage_roles
+    diar_pending: Optional[Tuple[threading.Thread, Dict[str, Any], List[Dict[str, str]]]] = None
+    # stage_cache: ASR/diarização reaproveitados e o que ainda falta gravar (turnos como listas simples)
+    asr_from_cache: bool = False
+    asr_cacheable: bool = False
+    diar_cached: Optional[Tuple[Any, bool, str]] = None
+    diar_store: Optional[List[List[Any]]] = None
+    # saída parcial (--partial_dir): pontuação já feita durante o ASR e o TXT parcial a remover no fim
+    punct_memo: Dict[str, str] = field(default_factory=dict)
+    partial_path: str = ""
+    # duração estimada antes do processamento (ordenação da fila e ETA por segundos de áudio)
+    est_duration_s: Optional[float] = None
+    # caminho já arquivado (reprocessamento a partir do cache): preservado se o arquivamento não o achar
+    archived_path: Optional[str] = None
+    # --profile auto: parâmetros e perfil escolhidos para este arquivo (None = ctx.asr_params)
+    asr_params: Optional[ASRParams] = None
+    profile: str = ""
+    # caminho do ASR (ASR_ROUTE_*): entra no params_hash do arquivo
+    asr_route: str = ""
+    # resumo da segunda passada (--escalate)
+    asr_escalation: Dict[str, Any] = field(default_factory=dict)
+    # envio ao pool (--workers > 1): base do tempo envio -> conclusão, separado do processamento
+    t_submit: float = 0.0
+    # tempo por etapa (s), pico de RSS do processo que rodou as etapas e threads ativas (metadata "performance")
+    timings: Dict[str, float] = field(default_factory=dict)
+    peak_rss_mb: Optional[float] = None
+    n_threads: int = 0
+    # None = imprime direto; lista = acumula (workers devolvem o log ao processo pai)
+    log_lines: Optional[List[str]] = None
+
+    @property
+    def name(self) -> str:
+        return self.audio_path.name
+
+    @contextlib.contextmanager
+    def timed(self, stage: str) -> Iterator[None]:
+        """Acumula o tempo de parede do bloco em timings[stage]."""
+        tick = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = round(self.timings.get(stage, 0.0) + time.perf_counter() - tick, 3)
+
+    def log(self, msg: str) -> None:
+        line = f"[{self.idx}/{self.total}] {self.name} | {msg}"
+        if self.log_lines is None:
+            print(line)
+        else:
+            self.log_lines.append(line)
+
+
+def _job_params(ctx: RunContext, job: FileJob) -> ASRParams:
+    return job.asr_params if job.asr_params is not None else ctx.asr_params
+
+
+def _apply_text_roles(ctx: RunContext, job: FileJob) -> None:
+    job.segments_final, job.role_stats, job.smooth_stats = role_by_text_smoothed(job.asr_segments, ctx.role_patterns)
+
+
+def _log_smoothing(job: FileJob) -> None:
+    if job.smooth_stats.get("changed", 0) > 0:
+        job.log(
+            f"Smoothing: {job.smooth_stats.get('changed')} correções | "
+            f"ilhas={job.smooth_stats.get('islands_fixed')} | pós-pergunta={job.smooth_stats.get('postq_fixed')}"
+        )
+
+
+def _start_diarization_async(ctx: RunContext, job: FileJob) -> None:
+    """A diarização só precisa do áudio: roda em paralelo ao ASR e é aguardada em _stage_roles."""
+    result: Dict[str, Any] = {}
+    diar_errors: List[Dict[str, str]] = []
+
+    def _run() -> None:
+        tick = time.perf_counter()
+        try:
+            result["value"] = _run_diarization_pyannote(job.audio_path, ctx.hf_token, ctx.asr_params.device, diar_errors, audio=job.audio)
+        except Exception as e:
+            diar_errors.append({"stage": "diar_thread", "error": f"{type(e).__name__}: {e}"})
+            result["value"] = (None, False, "diar_thread_failed")
+        result["elapsed"] = time.perf_counter() - tick
+
+    th = threading.Thread(target=_run, daemon=True)
+    th.start()
+    job.diar_pending = (th, result, diar_errors)
+
+
+def _collect_diarization(ctx: RunContext, job: FileJob):
+    if job.diar_cached is not None:
+        cached, job.diar_cached = job.diar_cached, None
+        return cached
+
+    if job.diar_pending is None:
+        with job.timed("diarization"):
+            return _run_diarization_pyannote(job.audio_path, ctx.hf_token, ctx.asr_params.device, job.errors, audio=job.audio)
+
+    th, result, diar_errors = job.diar_pending
+    job.diar_pending = None
+    with job.timed("diarization_wait"):  # parte da diarização paralela que não ficou escondida atrás do ASR
+        th.join()
+    job.timings["diarization"] = round(float(result.get("elapsed", 0.0)), 3)
+    job.errors.extend(diar_errors)
+    return result.get("value", (None, False, "diar_thread_failed"))
+
+
+PARTIAL_FLUSH_S = 30.0          # intervalo mínimo entre regravações do TXT parcial
+PARTIAL_SUFFIX = ".partial.txt"
+PARTIAL_ROLE_CONTEXT = 8        # linhas já escritas usadas como contexto do smoothing no parcial
+
+
+class _PartialTranscript:
+    """
+    Recebe os segmentos do ASR à medida que saem do gerador e, a cada PARTIAL_FLUSH_S, acrescenta
+    ao TXT parcial só os grupos de merge que fecharam desde o último flush. O grupo aberto (o
+    último, que ainda pode crescer) fica para o próximo flush; o flush final fecha tudo. Assim
+    cada segmento passa uma vez por pontuação/dicionário/split/papéis (textuais).
+    A pontuação fica no memo do job: a etapa de texto final só manda ao modelo o que é novo.
+    Os papéis do parcial são provisórios (a diarização só entra no resultado final); o smoothing
+    vê as últimas PARTIAL_ROLE_CONTEXT linhas já escritas como contexto.
+    """
+
+    def __init__(self, ctx: RunContext, job: FileJob, path: Path):
+        self.ctx = ctx
+        self.job = job
+        self.path = path
+        self.raw: List[Dict[str, Any]] = []
+        self.last_flush = time.time()
+        self.seen = 0        # len(raw) no último flush
+        self.tail = 0        # índice em raw onde começa o grupo de merge ainda aberto
+        self.context: List[Dict[str, Any]] = []
+        self.started = False
+
+    def add(self, seg: Dict[str, Any]) -> None:
+        self.raw.append(seg)
+        if time.time() - self.last_flush >= PARTIAL_FLUSH_S:
+            self.flush()
+
+    def flush(self, final: bool = False) -> None:
+        self.last_flush = time.time()
+        if len(self.raw) == self.seen and not (final and self.tail < len(self.raw)):
+            return
+        try:
+            segs, starts, _ = _merge_asr_groups(self.raw[self.tail:])
+            if not final and segs:
+                segs = segs[:-1]
+                self.tail += starts[-1]
+            else:
+                self.tail = len(self.raw)
+            self.seen = len(self.raw)
+            if not segs:
+                return
+
+            punct_model = _get_punct_model() if self.ctx.punctuation else None
+            if punct_model is not None:
+                _punctuate_segments(punct_model, segs, self.ctx.punct_batch_size, self.job.punct_memo)
+            if self.ctx.corretor is not None:
+                for seg in segs:
+                    seg["text"], _ = self.ctx.corretor.apply(seg.get("text", ""))
+            segs, _ = split_mixed_turns(segs)
+
+            context = self.context[-PARTIAL_ROLE_CONTEXT:]
+            roled, _, _ = role_by_text_smoothed(context + segs, self.ctx.role_patterns)
+            text = _build_txt(roled[len(context):], "no_token_role_by_text")
+            if not self.started:
+                _write_text(self.path, text)  # trunca um parcial de execução anterior
+                self.started = True
+            else:
+                with self.path.open("a", encoding="utf-8") as fh:
+                    fh.write(text)
+            self.context = (context + segs)[-PARTIAL_ROLE_CONTEXT:]
+            self.job.partial_path = str(self.path)
+            self.job.log(f"Parcial: {len(self.raw)} segmentos | {float(self.raw[-1]['end']):.0f}s de áudio -> {self.path.name}")
+        except Exception as e:
+            self.job.errors.append({"stage": "partial_flush", "error": f"{type(e).__name__}: {e}"})
+
+
+def _load_stage_cache(ctx: RunContext, job: FileJob) -> Optional[Dict[str, Any]]:
+    """Consulta ASR bruto e turnos da diarização no stage_cache; devolve o payload do ASR (ou None)."""
+    if not (ctx.stage_cache and ctx.cache_db_path and job.audio_hash):
+        return None
+
+    if ctx.hf_token:
+        diar = _stage_cache_get(ctx.cache_db_path, STAGE_DIAR, _diar_stage_key(job.audio_hash, ctx.asr_params.device), job.errors)
+        if diar is not None and isinstance(diar.get("turns"), list):
+            job.diar_cached = _diarization_from_turns(diar["turns"])
+
+    params = _job_params(ctx, job)
+    # o caminho já conhecido (cache final / reprocessamento) primeiro; depois os demais possíveis
+    routes = [job.asr_route] + [r for r in _asr_routes(params) if r != job.asr_route]
+    asr = None
+    for route in routes:
+        asr = _stage_cache_get(ctx.cache_db_path, STAGE_ASR, _asr_stage_key(job.audio_hash, params, route), job.errors)
+        if asr is not None and isinstance(asr.get("segments"), list):
+            job.asr_route = route
+            break
+        asr = None
+    if asr is None:
+        return None
+    job.asr_escalation = dict(asr.get("escalation") or {})
+    return asr
+
+
+def _prepare_asr(ctx: RunContext, job: FileJob, diar_async: bool = True) -> bool:
+    """Stage cache e decodificação; True = ainda falta transcrever o áudio."""
+    with job.timed("stage_cache"):
+        asr_cached = _load_stage_cache(ctx, job)
+    if asr_cached is not None:
+        job.asr_segments_raw = asr_cached["segments"]
+        job.duration_s = asr_cached.get("duration_s")
+        job.audio_info = dict(asr_cached.get("audio") or {})
+        job.asr_from_cache = True
+        diar_missing = bool(ctx.hf_token) and job.diar_cached is None
+        job.log(
+            f"ASR: stage_cache | Segmentos {len(job.asr_segments_raw)} | "
+            f"diarização {'em cache' if job.diar_cached is not None else ('a recalcular' if diar_missing else 'desabilitada')}"
+        )
+        if not diar_missing:
+            return False  # nada acústico a refazer: áudio nem é decodificado
+
+    t_dec = time.time()
+    with job.timed("decode"):
+        job.audio = _decode_audio(job.audio_path, job.errors, want_hash=not job.audio_hash)
+    if job.audio is not None:
+        job.duration_s = round(job.audio.duration_s, 3)
+        job.audio_info = {
+            "decoder": job.audio.decoder,
+            "sample_rate": job.audio.sample_rate,
+            "buffer_mb": round(job.audio.samples.nbytes / (1024.0 * 1024.0), 1),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+        if not job.audio_hash and job.audio.sha256:
+            # hash falhou antes da consulta ao cache: aproveita o calculado na decodificação
+            job.audio_hash = job.audio.sha256
+        job.log(f"Áudio decodificado uma vez | {job.audio.decoder} | {job.audio.sample_rate} Hz | {job.duration_s:.1f}s de áudio | {_format_elapsed(time.time() - t_dec)}")
+    elif not job.asr_from_cache:
+        job.duration_s = _try_get_wav_duration_seconds(job.audio_path)
+    if ctx.hf_token and ctx.diar_parallel and diar_async and job.diar_cached is None:
+        _start_diarization_async(ctx, job)
+    return not job.asr_from_cache
+
+
+def _stage_asr(ctx: RunContext, job: FileJob) -> None:
+    if _prepare_asr(ctx, job):
+        _transcribe_job(ctx, job)
+
+
+def _transcribe_job(ctx: RunContext, job: FileJob) -> None:
+    params = _job_params(ctx, job)
+    job.log(f"Início | Device={params.device} | Modelo={params.model}")
+    tick0 = time.time()
+    n_err = len(job.errors)
+    partial = _PartialTranscript(ctx, job, Path(ctx.partial_dir) / f"{job.audio_path.stem}{PARTIAL_SUFFIX}") if ctx.partial_dir else None
+    job.asr_route = ASR_ROUTE_CHUNKED if _uses_chunks(params, job.audio) else ""
+    with job.timed("asr"):
+        job.asr_segments_raw = _run_asr_faster_whisper(
+            job.audio_path,
+            params,
+            job.errors,
+            audio=job.audio,
+            on_segment=partial.add if partial is not None else None,
+            esc_stats=job.asr_escalation,
+        )
+    job.asr_cacheable = not any(str(e.get("stage", "")).startswith("asr") for e in job.errors[n_err:])
+    if partial is not None and job.asr_segments_raw:
+        partial.flush(final=True)  # parcial completo antes da diarização/papéis
+    job.log(f"ASR finalizado | Tempo parcial {_format_elapsed(time.time() - tick0)} | Segmentos {len(job.asr_segments_raw)}")
+
+
+def _asr_groups(ctx: RunContext, jobs: List[FileJob]) -> List[List[FileJob]]:
+    """Com --asr_batch_size, arquivos curtos consecutivos (com os mesmos parâmetros) formam grupos de até ASR_BATCH_FILES."""
+    if ctx.asr_params.batch_size <= 0:
+        return [[job] for job in jobs]
+    groups: List[List[FileJob]] = []
+    cur: List[FileJob] = []
+    for job in jobs:
+        if cur and _job_params(ctx, job) != _job_params(ctx, cur[0]):
+            groups.append(cur)
+            cur = []
+        short = job.est_duration_s is not None and job.est_duration_s <= ASR_BATCH_MAX_FILE_S
+        if not short:
+            if cur:
+                groups.append(cur)
+                cur = []
+            groups.append([job])
+            continue
+        cur.append(job)
+        if len(cur) >= ASR_BATCH_FILES:
+            groups.append(cur)
+            cur = []
+    if cur:
+        groups.append(cur)
+    return groups
+
+
+def _stage_asr_group(ctx: RunContext, jobs: List[FileJob]) -> None:
+    """
+    ASR de um grupo de arquivos curtos em lote. A diarização desses arquivos não é disparada
+    em paralelo (seriam várias ao mesmo tempo no mesmo pipeline): roda depois, em _stage_roles.
+    Se o lote falhar, cada arquivo segue pelo caminho normal.
+    """
+    if len(jobs) == 1:
+        _stage_asr(ctx, jobs[0])
+        return
+
+    todo = [job for job in jobs if _prepare_asr(ctx, job, diar_async=False)]
+    batch = [job for job in todo if job.audio is not None and job.audio.sample_rate == ASR_SAMPLE_RATE]
+    results = None
+    if len(batch) > 1:
+        tick0 = time.time()
+        n_err = [len(job.errors) for job in batch]
+        params = _job_params(ctx, batch[0])
+        results = _run_asr_batched([job.audio.samples for job in batch], params, [job.errors for job in batch])
+        if results is not None:
+            elapsed = time.time() - tick0
+            audio_s = sum(float(job.duration_s or 0.0) for job in batch)
+            for job, segs, n0 in zip(batch, results, n_err):
+                # tempo do lote rateado pela duração de cada arquivo
+                share = float(job.duration_s or 0.0) / audio_s if audio_s > 0 else 1.0 / len(batch)
+                job.timings["asr"] = round(elapsed * share, 3)
+                if params.escalate_model:
+                    with job.timed("asr"):
+                        segs = _finish_escalation(segs, job.audio, params, job.errors, job.asr_escalation)
+                job.asr_segments_raw = segs
+                job.asr_route = ASR_ROUTE_BATCHED
+                job.asr_cacheable = not any(str(e.get("stage", "")).startswith("asr") for e in job.errors[n0:])
+                job.log(
+                    f"ASR em lote ({len(batch)} arquivos, {audio_s:.0f}s de áudio) | "
+                    f"Tempo do lote {_format_elapsed(elapsed)} | Segmentos {len(segs)}"
+                )
+    done = {id(job) for job in batch} if results is not None else set()
+    for job in todo:
+        if id(job) not in done:
+            _transcribe_job(ctx, job)
+
+
+def _stage_text(ctx: RunContext, job: FileJob) -> None:
+    if not job.asr_segments_raw:
+        return
+
+    with job.timed("merge"):
+        asr_segments, job.merge_stats = _merge_asr_segments(job.asr_segments_raw)
+    job.log(f"Merge ASR: {job.merge_stats['merges']} junções | {job.merge_stats['in']} -> {job.merge_stats['out']} segmentos")
+
+    punct_model = _get_punct_model() if (ctx.punctuation and asr_segments) else None
+    if punct_model is not None:
+        tick = time.time()
+        from_partial = bool(job.punct_memo)
+        with job.timed("punctuation"):
+            n_new = _punctuate_segments(punct_model, asr_segments, ctx.punct_batch_size, job.punct_memo)
+        job.punct_memo = {}
+        job.punctuated = True
+        job.log(
+            f"Pontuação: {len(asr_segments)} segmentos em lote | {_format_elapsed(time.time() - tick)}"
+            + (f" | {n_new} novos, demais já pontuados na saída parcial" if from_partial else "")
+        )
+
+    job.total_corrigidas = 0
+    if ctx.dicionario:
+        corretor = ctx.corretor if ctx.corretor is not None else DictionaryCorrector(ctx.dicionario)
+        with job.timed("dictionary"):
+            for seg in asr_segments:
+                try:
+                    seg["text"], n_corr = corretor.apply(seg.get("text", ""))
+                    job.total_corrigidas += int(n_corr)
+                except Exception:
+                    pass
+
+    with job.timed("split"):
+        asr_segments, job.split_stats = split_mixed_turns(asr_segments)
+    if job.split_stats.get("changed", 0) > 0:
+        job.log(f"Split turnos: {job.split_stats['changed']} segmentos quebrados | {job.split_stats['in']} -> {job.split_stats['out']} segmentos")
+    else:
+        job.log(f"Split turnos: 0 | {job.split_stats['in']} -> {job.split_stats['out']} segmentos")
+
+    job.asr_segments = asr_segments
+
+
+def _stage_roles(ctx: RunContext, job: FileJob) -> None:
+    if not job.asr_segments_raw:
+        if job.diar_pending is not None:
+            _collect_diarization(ctx, job)
+        job.diarization_mode = "fallback_all_vendor"
+        job.segments_final = []
+        return
+
+    if ctx.hf_token:
+        from_cache = job.diar_cached is not None
+        ann, diar_ok, reason = _collect_diarization(ctx, job)
+        if ann is not None and not from_cache and reason in ("ok", "single_speaker"):
+            # resultado determinístico do pipeline: turnos vão para o stage_cache em _finalize_job
+            try:
+                job.diar_store = _annotation_turns(ann)
+            except Exception as e:
+                job.errors.append({"stage": "stage_cache_diarization", "error": f"{type(e).__name__}: {e}"})
+
+        assigned = None
+        assign_stats: Dict[str, Any] = {}
+        if ann is not None:
+            try:
+                assigned, assign_stats = _assign_speakers_to_segments(job.asr_segments, ann)
+            except Exception as e:
+                job.errors.append({"stage": "diar_assign", "error": f"{type(e).__name__}: {e}"})
+                assigned = None
+
+        diar_ok2 = False
+        if assigned is not None:
+            diar_ok2, job.diar_quality = assess_diarization_quality(ann, assigned, assign_stats=assign_stats)
+            job.diar_quality["multi_speaker_segments"] = assign_stats.get("multi_speaker_segments", 0)
+            job.diar_quality["overlap_speech_segments"] = assign_stats.get("overlap_speech_segments", 0)
+        else:
+            job.diar_quality = {"ok": False, "speakers": 0, "collapsed": None, "max_share": None, "coverage": None}
+
+        spk_n = job.diar_quality.get("speakers")
+        max_share = job.diar_quality.get("max_share")
+        coverage = job.diar_quality.get("coverage")
+        ms = f"{float(max_share):.3f}" if isinstance(max_share, (int, float)) else "n/a"
+        cv = f"{float(coverage):.3f}" if isinstance(coverage, (int, float)) else "n/a"
+
+        if diar_ok and diar_ok2 and assigned is not None:
+            job.segments_final = assigned
+            job.diarization_mode = "pyannote_ok"
+            job.log(f"Diarização acústica: aprovada | speakers={spk_n} | max_share={ms} | coverage={cv}")
+
+        else:
+            collapsed = job.diar_quality.get("collapsed")
+            job.log(
+                f"Diarização acústica: rejeitada | motivo={reason} | "
+                f"speakers={spk_n} | collapsed={collapsed} | max_share={ms} | coverage={cv}"
+            )
+
+            job.errors.append({"stage": "diar_quality", "error": f"diarization_not_reliable: {reason} | assessed_ok={diar_ok2} | stats={job.diar_quality}"})
+
+            _apply_text_roles(ctx, job)
+            job.diarization_mode = "pyannote_failed_role_by_text"
+
+            job.log(
+                f"Fallback textual: aplicado | "
+                f"vendedor={job.role_stats.get('vendor_pct')}% cliente={job.role_stats.get('client_pct')}% | "
+                f"conf_média={job.role_stats.get('mean_conf')}"
+            )
+            _log_smoothing(job)
+
+    else:
+        _apply_text_roles(ctx, job)
+        job.diarization_mode = "no_token_role_by_text"
+
+        job.log(
+            f"Diarização acústica: indisponível | "
+            f"Fallback textual: aplicado | vendedor={job.role_stats.get('vendor_pct')}% cliente={job.role_stats.get('client_pct')}% | "
+            f"conf_média={job.role_stats.get('mean_conf')}"
+        )
+        _log_smoothing(job)
+
+    if not job.segments_final:
+        job.diarization_mode = "fallback_all_vendor"
+        job.segments_final = job.asr_segments
+        job.log("Aviso: role_by_text não produziu segmentos. Mantendo fallback total vendedor.")
+
+
+def _stage_roles_and_log(ctx: RunContext, job: FileJob) -> None:
+    tick = time.perf_counter()
+    try:
+        _stage_roles(ctx, job)
+    finally:
+        job.audio = None
+    # papéis = etapa inteira menos a espera/execução síncrona da diarização
+    diar_s = job.timings.get("diarization_wait", 0.0) if "diarization_wait" in job.timings else job.timings.get("diarization", 0.0)
+    job.timings["roles"] = round(max(0.0, time.perf_counter() - tick - diar_s), 3)
+    # medidos aqui porque, com --workers, esta é a última etapa dentro do worker
+    job.peak_rss_mb = _peak_rss_mb()
+    job.n_threads = threading.active_count()
+    job.log(f"Correções lexicais (dicionário): {job.total_corrigidas}")
+
+
+# Ordem fixa das etapas de um arquivo (usada no modo sequencial, nos workers e no pipeline)
+_FILE_STAGES = (_stage_asr, _stage_text, _stage_roles_and_log)
+
+
+def _process_audio(ctx: RunContext, job: FileJob) -> FileJob:
+    for stage in _FILE_STAGES:
+        stage(ctx, job)
+    return job
+
+
+# ------------------------------
+# Pipeline em etapas (modo sequencial)
+# ------------------------------
+_PIPE_END = None  # sentinela de fim de fila
+
+
+def _run_pipelined(
+    ctx: RunContext,
+    jobs: List[FileJob],
+    on_done: Callable[[FileJob], None],
+    queue_size: int = 2,
+) -> None:
+    """
+    Uma thread por etapa (ASR -> texto -> diarização/papéis), ligadas por filas limitadas.
+    Enquanto o arquivo N está na diarização, o N+1 já está no ASR; o throughput tende ao
+    custo da etapa mais lenta. on_done roda na thread principal (escrita/arquivamento/cache).
+    """
+    import queue
+
+    queues: List[Any] = [queue.Queue(maxsize=max(1, queue_size)) for _ in range(len(_FILE_STAGES))]
+
+    def _feed() -> None:
+        # a etapa de ASR recebe grupos (um arquivo, ou vários curtos com --asr_batch_size)
+        for group in _asr_groups(ctx, jobs):
+            queues[0].put(group)
+        queues[0].put(_PIPE_END)
+
+    def _run_stage(i: int) -> None:
+        try:
+            _stage_loop(i)
+        finally:
+            _close_stage_db()
+
+    def _stage_loop(i: int) -> None:
+        stage = _FILE_STAGES[i]
+        q_in = queues[i]
+        q_out = queues[i + 1] if i + 1 < len(queues) else done_q
+        while True:
+            job = q_in.get()
+            if job is _PIPE_END:
+                q_out.put(_PIPE_END)
+                return
+            if i == 0:
+                group = job
+                for job in group:
+                    job.t0 = time.time()
+                try:
+                    _stage_asr_group(ctx, group)
+                except Exception as e:
+                    for job in group:
+                        job.errors.append({"stage": "pipeline__stage_asr", "error": f"{type(e).__name__}: {e}"})
+                for job in group:
+                    q_out.put(job)
+                continue
+            try:
+                stage(ctx, job)
+            except Exception as e:
+                job.errors.append({"stage": f"pipeline_{stage.__name__}", "error": f"{type(e).__name__}: {e}"})
+            q_out.put(job)
+
+    done_q: Any = queue.Queue(maxsize=max(1, queue_size))
+    threads = [threading.Thread(target=_feed, daemon=True)]
+    threads += [threading.Thread(target=_run_stage, args=(i,), daemon=True) for i in range(len(_FILE_STAGES))]
+    for th in threads:
+        th.start()
+
+    while True:
+        job = done_q.get()
+        if job is _PIPE_END:
+            break
+        on_done(job)
+
+    for th in threads:
+        th.join(timeout=2.0)
+
+
+def _performance(ctx: RunContext, job: FileJob) -> Dict[str, Any]:
+    """
+    Tempos por etapa, RTF (tempo de processamento / duração do áudio), pico de RSS e threads.
+    Escrita, arquivamento e cache acontecem depois do JSON: esses tempos só vão para o resumo da execução.
+    """
+    params = ctx.asr_params
+    processing_s = round(time.time() - job.t0, 3)
+    dur = float(job.duration_s or 0.0)
+    asr_s = job.timings.get("asr")
+    return {
+        "timings_s": dict(job.timings),
+        "processing_s": processing_s,
+        "rtf": round(processing_s / dur, 4) if dur > 0 else None,
+        "asr_rtf": round(asr_s / dur, 4) if (dur > 0 and asr_s is not None) else None,
+        "peak_rss_mb": job.peak_rss_mb if job.peak_rss_mb is not None else _peak_rss_mb(),
+        "threads": {
+            "active": job.n_threads or threading.active_count(),
+            # por chunk quando o arquivo foi dividido; senão o do processo/worker inteiro
+            "cpu_threads": (_chunk_params(params) if job.asr_route == ASR_ROUTE_CHUNKED else params).cpu_threads,
+            "chunk_workers": params.chunk_workers,
+            "workers": ctx.workers,
+        },
+    }
+
+
+def _build_outputs(ctx: RunContext, job: FileJob) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+    params = _job_params(ctx, job)
+    meta: Dict[str, Any] = {
+        "file": str(job.audio_path.resolve()),
+        "file_name": job.audio_path.name,
+        "duration_seconds": job.duration_s,
+        "asr": {
+            "engine": "faster-whisper",
+            "model": params.model,
+            "language": params.language,
+            "device": params.device,
+            "compute_type": params.compute_type,
+            "vad_filter": params.vad_filter,
+            "beam_size": params.beam_size,
+            "profile": job.profile or ctx.profile,
+            "escalation": job.asr_escalation or None,
+            "chunked": (
+                {"workers": params.chunk_workers, "min_s": ASR_CHUNK_MIN_S, "max_s": ASR_CHUNK_MAX_S, "overlap_s": ASR_CHUNK_OVERLAP_S}
+                if job.asr_route == ASR_ROUTE_CHUNKED
+                else None
+            ),
+            "batched": (
+                {"batch_size": params.batch_size, "clip_s": ASR_BATCH_CLIP_S}
+                if job.asr_route == ASR_ROUTE_BATCHED
+                else None
+            ),
+        },
+        "audio": job.audio_info,
+        "punctuation": job.punctuated,
+        "post_hash": ctx.post_hash,
+        "merge": job.merge_stats,
+        "split_turnos": job.split_stats,
+        "diarization": job.diarization_mode,
+        "created_at": _now_iso(),
+        "performance": _performance(ctx, job),
+        "quality": {
+            "role_by_text": job.role_stats,
+            "smoothing": job.smooth_stats,
+            "pyannote_assessment": job.diar_quality,
+        },
+        "assets": {
+            "dict_path": str(Path(ctx.dict_path)),
+            "roles_vendor_path": str(Path(ctx.roles_vendor_path)),
+            "roles_client_path": str(Path(ctx.roles_client_path)),
+            "roles_loaded": ctx.role_pat_stats,
+        },
+    }
+
+    json_obj: Dict[str, Any] = {
+        "metadata": meta,
+        "diarization": job.diarization_mode,
+        "errors": job.errors,
+        "segments": job.segments_final,
+    }
+
+    txt_content = _build_txt(job.segments_final, job.diarization_mode)
+    return meta, json_obj, txt_content
+
+
+# ------------------------------
+# Fila: duração estimada, ordem e ETA
+# ------------------------------
+def _estimate_durations(jobs: List[FileJob]) -> None:
+    """
+    Duração de cada job pelo cabeçalho do arquivo. Sem cabeçalho legível, estima pelo tamanho
+    usando a taxa média (bytes/s) dos arquivos sondados; sem nenhuma referência, usa a taxa
+    nominal EST_BYTES_PER_S.
+    """
+    sizes: Dict[int, int] = {}
+    known_bytes = 0
+    known_secs = 0.0
+    for k, job in enumerate(jobs):
+        try:
+            sizes[k] = int(job.audio_path.stat().st_size)
+        except Exception:
+            sizes[k] = 0
+        job.est_duration_s = _probe_duration_seconds(job.audio_path)
+        if job.est_duration_s:
+            known_bytes += sizes[k]
+            known_secs += job.est_duration_s
+
+    rate = (known_bytes / known_secs) if known_secs > 0 and known_bytes > 0 else EST_BYTES_PER_S
+    for k, job in enumerate(jobs):
+        if job.est_duration_s is None:
+            job.est_duration_s = sizes[k] / rate
+
+
+def _order_jobs(jobs: List[FileJob], order: str) -> List[FileJob]:
+    """longest: maiores primeiro (LPT), para a cauda do lote não ficar com uma ligação longa."""
+    if order == "longest":
+        return sorted(jobs, key=lambda j: -(j.est_duration_s or 0.0))
+    return list(jobs)
+
+
+# ------------------------------
+# Perfis de ASR (--profile / --deadline / --escalate)
+# ------------------------------
+def _profile_params(base: ASRParams, profile: str, escalate: bool) -> ASRParams:
+    """Parâmetros de um perfil; a segunda passada só faz sentido se o modelo do perfil não for o ESCALATE_MODEL."""
+    spec = ASR_PROFILES[profile]
+    compute_type = spec.get("compute_type_cuda", base.compute_type) if base.device == "cuda" else base.compute_type
+    return replace(
+        base,
+        model=str(spec["model"]),
+        beam_size=int(spec["beam_size"]),
+        compute_type=compute_type,
+        escalate_model=ESCALATE_MODEL if (escalate and spec["model"] != ESCALATE_MODEL) else "",
+    )
+
+
+def _plan_profiles(ctx: RunContext, jobs: List[FileJob], deadline_s: float, workers: int, escalate: bool) -> None:
+    """
+    --profile auto: escolhe o perfil de cada arquivo antes do processamento. Sem prazo, tudo vai
+    no mais preciso. Com prazo, o custo estimado do ASR (RTF do perfil x duração, dividido pelos
+    workers) precisa caber no tempo restante: os arquivos mais longos são rebaixados primeiro,
+    um nível por vez, e as ligações curtas mantêm o perfil mais preciso. Arquivos que já têm
+    perfil (ASR em stage_cache) ficam como estão.
+    """
+    rtf = ASR_PROFILE_RTF.get(ctx.asr_params.device, ASR_PROFILE_RTF["cpu"])
+    missing = [job for job in jobs if job.est_duration_s is None]
+    if missing:
+        _estimate_durations(missing)
+
+    free = [job for job in jobs if not job.profile]
+    level = {id(job): 0 for job in free}
+    cost = sum(rtf[ASR_PROFILE_ORDER[0]] * float(job.est_duration_s or 0.0) for job in free)
+    budget = deadline_s * max(1, workers) if deadline_s > 0 else None
+    if budget is not None:
+        by_len = sorted(free, key=lambda j: -float(j.est_duration_s or 0.0))
+        for lvl in range(len(ASR_PROFILE_ORDER) - 1):
+            for job in by_len:
+                if cost <= budget:
+                    break
+                cur, nxt = ASR_PROFILE_ORDER[lvl], ASR_PROFILE_ORDER[lvl + 1]
+                if level[id(job)] == lvl:
+                    cost -= (rtf[cur] - rtf[nxt]) * float(job.est_duration_s or 0.0)
+                    level[id(job)] = lvl + 1
+            if cost <= budget:
+                break
+    for job in free:
+        job.profile = ASR_PROFILE_ORDER[level[id(job)]]
+
+    by_profile = {name: _profile_params(ctx.asr_params, name, escalate) for name in ASR_PROFILE_ORDER}
+    counts = {name: 0 for name in ASR_PROFILE_ORDER}
+    for job in jobs:
+        job.asr_params = by_profile[job.profile]
+        counts[job.profile] += 1
+
+    line = "Perfis (auto): " + " ".join(f"{name}={counts[name]}" for name in ASR_PROFILE_ORDER)
+    line += f" | ASR estimado ~{cost / max(1, workers) / 60.0:.1f} min"
+    if budget is not None:
+        line += f" | prazo restante {deadline_s / 60.0:.1f} min"
+        if cost > budget:
+            line += " | Aviso: prazo não alcançável nem com o perfil fast"
+    print(line)
+
+
+class _BatchProgress:
+    """ETA por segundos de áudio (não por número de arquivos): arquivos longos pesam o que custam."""
+
+    def __init__(self, jobs: List[FileJob]):
+        self.total = len(jobs)
+        self.total_audio_s = sum(float(j.est_duration_s or 0.0) for j in jobs)
+        self.done = 0
+        self.done_audio_s = 0.0
+        self.t0 = time.time()
+
+    def update(self, job: FileJob) -> None:
+        self.done += 1
+        self.done_audio_s += float(job.est_duration_s or job.duration_s or 0.0)
+        elapsed = time.time() - self.t0
+        remaining = max(0.0, self.total_audio_s - self.done_audio_s)
+        if self.done_audio_s > 0:
+            eta = remaining * elapsed / self.done_audio_s
+        else:
+            eta = (self.total - self.done) * elapsed / max(1, self.done)
+        print(
+            f"  Progresso: {self.done}/{self.total} | áudio {self.done_audio_s / 60.0:.1f}/{self.total_audio_s / 60.0:.1f} min | "
+            f"ETA: {_format_elapsed(eta)}"
+        )
+
+
+# ------------------------------
+# Workers (processos)
+# ------------------------------
+_WORKER_CTX: Optional[RunContext] = None
+
+
+def _write_run_summary(path: Path, ctx: RunContext, mode: str, t0: float, extra: Dict[str, Any]) -> None:
+    """Resumo da execução em JSON: totais, RTF do lote, tempo somado por etapa e uma linha por arquivo."""
+    params = ctx.asr_params
+    rows = ctx.summary_rows
+    elapsed = time.time() - t0
+    audio_s = sum(float(r.get("duration_s") or 0.0) for r in rows)
+    stage_totals: Dict[str, float] = {}
+    for r in rows:
+        for stage, sec in (r.get("timings_s") or {}).items():
+            stage_totals[stage] = round(stage_totals.get(stage, 0.0) + float(sec), 3)
+    peaks = [float(r["peak_rss_mb"]) for r in rows if r.get("peak_rss_mb") is not None]
+    own_peak = _peak_rss_mb()
+    summary: Dict[str, Any] = {
+        "created_at": _now_iso(),
+        "mode": mode,
+        "asr": {
+            "model": params.model,
+            "device": params.device,
+            "compute_type": params.compute_type,
+            "beam_size": params.beam_size,
+            "chunk_workers": params.chunk_workers,
+            "batch_size": params.batch_size,
+        },
+        **extra,
+        "processed": len(rows),
+        "elapsed_s": round(elapsed, 3),
+        "audio_s": round(audio_s, 3),
+        # RTF do lote: tempo de parede da execução inteira / áudio processado
+        "rtf": round(elapsed / audio_s, 4) if audio_s > 0 else None,
+        "peak_rss_mb": max(peaks + ([own_peak] if own_peak is not None else [])) if (peaks or own_peak is not None) else None,
+        "threads": {
+            "cpu_count": os.cpu_count(),
+            "workers": ctx.workers,
+            "cpu_threads": params.cpu_threads,
+            "chunk_workers": params.chunk_workers,
+        },
+        "stage_totals_s": stage_totals,
+        "files": rows,
+    }
+    try:
+        _write_text(path, _json_text(summary))
+        print(f"Resumo da execução: {path}")
+    except Exception as e:
+        print(f"Aviso: falha ao salvar o resumo da execução. Motivo: {type(e).__name__}: {e}")
+
+
+def _split_cpu_threads(workers: int) -> int:
+    n_cpu = os.cpu_count() or 1
+    return max(1, n_cpu // max(1, workers))
+
+
+def _print_chunk_threads(params: ASRParams) -> None:
+    if params.chunk_workers > 0:
+        print(
+            f"ASR em chunks (áudios > {ASR_CHUNK_MAX_S:.0f}s): {params.chunk_workers} em paralelo | "
+            f"cpu_threads por chunk={_chunk_params(params).cpu_threads}"
+        )
+
+
+def _worker_init(ctx: RunContext) -> None:
+    global _WORKER_CTX
+    _WORKER_CTX = ctx
+    _STAGE_DB_LOCAL.db = None  # conexão herdada do pai (fork) não é usada nem fechada aqui
+
+    if ctx.hf_token and ctx.asr_params.cpu_threads > 0:
+        try:
+            import torch  # type: ignore
+            torch.set_num_threads(int(ctx.asr_params.cpu_threads))
+        except Exception:
+            pass
+
+    # pré-carrega o modelo do worker (falhas são registradas por arquivo no primeiro uso);
+    # com --profile auto o modelo depende do arquivo e é carregado sob demanda
+    if ctx.profile != "auto":
+        _get_whisper_model(ctx.asr_params, [])
+
+
+def _worker_process(job: FileJob) -> FileJob:
+    ctx = _WORKER_CTX
+    if ctx is None:
+        raise RuntimeError("worker_not_initialized")
+    job.log_lines = []
+    job.t0 = time.time()  # relógio do processamento começa quando o worker pega o arquivo, não na fila
+    try:
+        return _process_audio(ctx, job)
+    finally:
+        _close_stage_db()
+
+
+# =============================================================================
+# Saídas / cache por arquivo (sempre no processo principal)
+# =============================================================================
+def _output_paths(job: FileJob, txt_dir: Path, json_dir: Path, json_format: str = "json") -> Tuple[Path, Path]:
+    stem = job.audio_path.stem
+    return txt_dir / f"{stem}.txt", json_dir / f"{stem}{_JSON_FORMAT_SUFFIX.get(json_format, '.json')}"
+
+
+def _post_current(cached: Dict[str, Any], post_hash: str) -> bool:
+    """Entradas anteriores ao post_hash continuam válidas (não forçam reprocessamento em massa)."""
+    stored = (cached.get("meta") or {}).get("post_hash")
+    return not stored or stored == post_hash
+
+
+def _write_text_if_changed(db: CacheDB, path: Path, content: str) -> bool:
+    """
+    Escreve só se o conteúdo mudou. O sha256 do conteúdo atual vem do índice de stat
+    (fingerprints); o arquivo só é lido quando o stat não bate. Devolve True se escreveu.
+    """
+    digest = _sha256_bytes(content.encode("utf-8"))
+    key = str(path.resolve())
+    try:
+        st: Optional[os.stat_result] = path.stat()
+    except OSError:
+        st = None
+
+    if st is not None:
+        try:
+            current = db.get_fingerprint(key, st)
+        except Exception:
+            current = None
+        if current is None:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    current = _sha256_bytes(f.read().encode("utf-8"))
+                db.put_fingerprint(key, st, current)
+            except Exception:
+                current = None
+        if current == digest:
+            return False
+
+    _write_text(path, content)
+    try:
+        db.put_fingerprint(key, path.stat(), digest)
+    except Exception:
+        pass
+    return True
+
+
+def _serve_from_cache(
+    job: FileJob,
+    cached: Dict[str, Any],
+    cache_dir: Path,
+    txt_dir: Path,
+    json_dir: Path,
+    db: Optional[CacheDB] = None,
+    json_format: str = "json",
+) -> bool:
+    """db informado = modo --skip_unchanged: saídas idênticas às existentes não são reescritas."""
+    out_txt, out_json = _output_paths(job, txt_dir, json_dir, json_format)
+    try:
+        json_content = _json_output_text(cached["json"], json_format)
+        if db is None:
+            _write_text(out_txt, cached["txt"])
+            _write_text(out_json, json_content)
+            written = 2
+        else:
+            written = int(_write_text_if_changed(db, out_txt, cached["txt"]))
+            written += int(_write_text_if_changed(db, out_json, json_content))
+        if job.audio_path.exists():
+            try:
+                _archive_audio(job.audio_path, cache_dir, job.audio_hash)
+            except Exception:
+                pass
+        elapsed = time.time() - job.t0
+        job.log(f"Cache: HIT | Tempo: {_format_elapsed(elapsed)} | " + ("TXT/JSON regenerados" if written else "saídas já atualizadas (sem escrita)"))
+        return True
+    except Exception as e:
+        job.log(f"Cache: HIT, mas falhou ao escrever saídas. Reprocessando. Motivo: {type(e).__name__}: {e}")
+        return False
+
+
+def _store_stage_cache(ctx: RunContext, job: FileJob, db: CacheDB) -> None:
+    if not job.audio_hash:
+        return
+    try:
+        if job.asr_cacheable and not job.asr_from_cache:
+            db.put_stage(
+                STAGE_ASR,
+                _asr_stage_key(job.audio_hash, _job_params(ctx, job), job.asr_route),
+                job.audio_hash,
+                {
+                    "segments": job.asr_segments_raw,
+                    "duration_s": job.duration_s,
+                    "audio": job.audio_info,
+                    "escalation": job.asr_escalation or None,
+                },
+            )
+        if job.diar_store is not None:
+            db.put_stage(STAGE_DIAR, _diar_stage_key(job.audio_hash, ctx.asr_params.device), job.audio_hash, {"turns": job.diar_store})
+    except Exception as e:
+        job.log(f"Aviso: falha ao salvar cache de etapa. Motivo: {type(e).__name__}: {e}")
+
+
+def _finalize_job(
+    ctx: RunContext,
+    job: FileJob,
+    db: CacheDB,
+    cache_dir: Path,
+    txt_dir: Path,
+    json_dir: Path,
+) -> None:
+    # hash dos parâmetros e do caminho que o ASR deste arquivo tomou (perfil do --profile auto, chunks, lote)
+    params_hash = _params_hash(_job_params(ctx, job), job.asr_route)
+    out_txt, out_json = _output_paths(job, txt_dir, json_dir, ctx.json_format)
+    meta, json_obj, txt_content = _build_outputs(ctx, job)
+
+    with job.timed("write"):
+        try:
+            _write_text(out_txt, txt_content)
+        except Exception as e:
+            job.log(f"Erro ao salvar TXT: {type(e).__name__}: {e}")
+
+        try:
+            _write_text(out_json, _json_output_text(json_obj, ctx.json_format))
+        except Exception as e:
+            job.log(f"Erro ao salvar JSON: {type(e).__name__}: {e}")
+
+    if job.partial_path:
+        # o TXT final substitui o parcial
+        try:
+            Path(job.partial_path).unlink(missing_ok=True)  # type: ignore[arg-type]
+        except Exception:
+            pass
+
+    archived_path = None
+    if job.audio_hash:
+        with job.timed("archive"):
+            try:
+                archived = _archive_audio(job.audio_path, cache_dir, job.audio_hash)
+                archived_path = str(archived) if archived else None
+                if archived:
+                    # o arquivo arquivado já tem hash conhecido: entra no índice sem releitura
+                    db.put_fingerprint(str(archived), archived.stat(), job.audio_hash)
+            except Exception:
+                archived_path = None
+    archived_path = archived_path or job.archived_path
+
+    if job.audio_hash:
+        job.cache_key = _sha256_bytes(f"{job.audio_hash}{params_hash}".encode("utf-8"))
+
+    tick_cache = time.perf_counter()
+    _store_stage_cache(ctx, job, db)
+
+    if job.cache_key:
+        try:
+            meta_cache = dict(meta)
+            meta_cache["archived_path"] = archived_path
+            db.upsert(
+                cache_key=job.cache_key,
+                audio_hash=job.audio_hash,
+                params_hash=params_hash,
+                orig_name=job.audio_path.stem,
+                orig_ext=job.audio_path.suffix.lower(),
+                archived_path=archived_path,
+                meta=meta_cache,
+                txt_content=txt_content,
+                json_obj=json_obj,
+            )
+        except Exception as e:
+            job.log(f"Aviso: falha ao salvar cache. Motivo: {type(e).__name__}: {e}")
+    job.timings["cache"] = round(time.perf_counter() - tick_cache, 3)
+
+    elapsed = time.time() - job.t0
+    perf = meta["performance"]
+    ctx.summary_rows.append({
+        "file": job.audio_path.name,
+        "duration_s": job.duration_s,
+        "processing_s": round(elapsed, 3),
+        "rtf": round(elapsed / float(job.duration_s), 4) if job.duration_s else None,
+        "submit_to_done_s": round(time.time() - job.t_submit, 3) if job.t_submit else None,
+        "timings_s": dict(job.timings),
+        "peak_rss_mb": perf.get("peak_rss_mb"),
+        "diarization": job.diarization_mode,
+        "errors": len(job.errors),
+    })
+    job.log(f"Método: {job.diarization_mode} | Erros: {len(job.errors)} | Tempo: {_format_elapsed(elapsed)} | Saídas: OK")
+
+
+def _run_pool(
+    ctx: RunContext,
+    jobs: List[FileJob],
+    workers: int,
+    db: CacheDB,
+    cache_dir: Path,
+    txt_dir: Path,
+    json_dir: Path,
+) -> None:
+    """
+    Distribui os arquivos entre N processos (cada um com seu modelo pré-carregado).
+    O processo pai imprime os logs de cada arquivo ao receber o resultado e é o único
+    que escreve TXT/JSON, arquiva áudio e grava no CacheDB.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    progress = _BatchProgress(jobs)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init, initargs=(ctx,)) as ex:
+        futs = {}
+        for job in jobs:
+            # t0 é refeito no worker; t_submit mede envio -> conclusão (inclui a espera na fila)
+            job.t0 = job.t_submit = time.time()
+            futs[ex.submit(_worker_process, job)] = job
+
+        for fut in as_completed(futs):
+            job = futs[fut]
+            try:
+                res = fut.result()
+                for line in res.log_lines or []:
+                    print(line)
+                res.log_lines = None
+                job = res
+            except Exception as e:
+                # worker caiu: ainda assim gera saída (fallback) para o arquivo
+                job.log_lines = None
+                job.errors.append({"stage": "worker", "error": f"{type(e).__name__}: {e}"})
+                job.diarization_mode = "fallback_all_vendor"
+                job.log(f"Erro no worker: {type(e).__name__}: {e}")
+
+            _finalize_job(ctx, job, db, cache_dir, txt_dir, json_dir)
+            progress.update(job)
+
+
+# =============================================================================
+# Reprocessamento a partir do cache (--reprocess_from_cache)
+# =============================================================================
+def _stage_from_cache(ctx: RunContext, job: FileJob) -> None:
+    """Primeira etapa do reprocessamento: ASR e turnos vêm do stage_cache; o áudio não é lido."""
+    asr = _load_stage_cache(ctx, job)
+    if asr is None:
+        job.errors.append({"stage": "reprocess_asr_cache", "error": "asr_not_cached"})
+        return
+    job.asr_segments_raw = asr["segments"]
+    job.duration_s = asr.get("duration_s")
+    job.audio_info = dict(asr.get("audio") or {})
+    job.asr_from_cache = True
+    if ctx.hf_token and job.diar_cached is None:
+        # sem turnos em cache não há diarização a reaproveitar: segue o fallback textual
+        job.diar_cached = (None, False, "diar_not_cached")
+    job.log(f"Reprocessamento: ASR do stage_cache | Segmentos {len(job.asr_segments_raw)}")
+
+
+_REPROCESS_STAGES = (_stage_from_cache, _stage_text, _stage_roles_and_log)
+
+
+def _reprocess_job(ctx: RunContext, job: FileJob) -> FileJob:
+    for stage in _REPROCESS_STAGES:
+        stage(ctx, job)
+    return job
+
+
+def _worker_init_text(ctx: RunContext) -> None:
+    # só etapas de texto: nenhum modelo acústico é carregado
+    global _WORKER_CTX
+    _WORKER_CTX = ctx
+    _STAGE_DB_LOCAL.db = None  # conexão herdada do pai (fork) não é usada nem fechada aqui
+
+
+def _worker_reprocess(job: FileJob) -> FileJob:
+    ctx = _WORKER_CTX
+    if ctx is None:
+        raise RuntimeError("worker_not_initialized")
+    job.log_lines = []
+    job.t0 = time.time()
+    try:
+        return _reprocess_job(ctx, job)
+    finally:
+        _close_stage_db()
+
+
+def _job_from_cache_row(row: Dict[str, Any], idx: int, total: int) -> FileJob:
+    meta = row.get("meta") or {}
+    src = meta.get("file") or f"{row.get('orig_name', '')}{row.get('orig_ext', '')}"
+    job = FileJob(idx=idx, total=total, audio_path=Path(src), t0=time.time())
+    job.audio_hash = row.get("audio_hash") or ""
+    job.cache_key = row.get("cache_key") or ""
+    job.archived_path = row.get("archived_path")
+    return job
+
+
+def _run_reprocess(
+    ctx: RunContext,
+    db: CacheDB,
+    workers: int,
+    force: bool,
+    cache_dir: Path,
+    txt_dir: Path,
+    json_dir: Path,
+    params_hash: str,
+    params: Optional[ASRParams] = None,
+    profile: str = "",
+    route: str = "",
+) -> Dict[str, int]:
+    """
+    params/profile/route: entradas de um perfil do --profile auto (None = ctx.asr_params) e de um caminho do ASR.
+    Percorre o cache.db em páginas e refaz merge/pontuação/dicionário/split/papéis com os assets
+    e constantes atuais. Entradas com post_hash atual são puladas (exceto com --force); entradas
+    sem ASR no stage_cache (anteriores a ele) ficam como estão. Com workers > 1 os arquivos vão
+    para processos só de texto, com no máximo 4 por worker em voo.
+    """
+    total = db.count_transcriptions(params_hash)
+    stats = {"total": total, "reprocessados": 0, "atuais": 0, "sem_asr": 0, "falhas": 0}
+
+    def _jobs() -> Iterator[FileJob]:
+        for idx, row in enumerate(db.iter_transcriptions(params_hash), start=1):
+            if not force and (row.get("meta") or {}).get("post_hash") == ctx.post_hash:
+                stats["atuais"] += 1
+                continue
+            job = _job_from_cache_row(row, idx, total)
+            job.asr_params, job.profile, job.asr_route = params, profile, route
+            yield job
+
+    def _done(job: FileJob) -> None:
+        if not job.asr_from_cache:
+            stats["sem_asr"] += 1
+            job.log("Reprocessamento: ASR fora do stage_cache | saídas mantidas")
+            return
+        _finalize_job(ctx, job, db, cache_dir, txt_dir, json_dir)
+        stats["reprocessados"] += 1
+
+    if workers <= 1:
+        for job in _jobs():
+            try:
+                _reprocess_job(ctx, job)
+            except Exception as e:
+                stats["falhas"] += 1
+                job.log(f"Erro no reprocessamento: {type(e).__name__}: {e}")
+                continue
+            _done(job)
+        return stats
+
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    jobs_iter = _jobs()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init_text, initargs=(ctx,)) as ex:
+        inflight: Dict[Any, FileJob] = {}
+
+        def _submit_next() -> bool:
+            job = next(jobs_iter, None)
+            if job is None:
+                return False
+            job.t0 = job.t_submit = time.time()
+            inflight[ex.submit(_worker_reprocess, job)] = job
+            return True
+
+        while len(inflight) < workers * 4 and _submit_next():
+            pass
+
+        while inflight:
+            finished, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                job = inflight.pop(fut)
+                try:
+                    res = fut.result()
+                    for line in res.log_lines or []:
+                        print(line)
+                    res.log_lines = None
+                    _done(res)
+                except Exception as e:
+                    stats["falhas"] += 1
+                    job.log_lines = None
+                    job.log(f"Erro no worker: {type(e).__name__}: {e}")
+                _submit_next()
+
+    return stats
+
+
 # =============================================================================
 # Args
 # =============================================================================
@@ -1277,13 +4412,72 @@ def build_argparser() -> argparse.ArgumentParser:
     ap.add_argument("--device", default="auto")
     # dica: em CPU, beam 3 costuma ser bem mais rápido; mantenho 5 como você vinha usando
     ap.add_argument("--beam_size", type=int, default=5)
+    ap.add_argument(
+        "--profile",
+        default="manual",
+        choices=("manual",) + ASR_PROFILE_ORDER + ("auto",),
+        help="Perfil de ASR: manual (--model/--beam_size), accurate (large-v3, beam 5), balanced (medium, beam 3), "
+        "fast (small, beam 1) ou auto (por arquivo, conforme duração, fila e --deadline)",
+    )
+    ap.add_argument("--deadline", type=float, default=0.0, help="Prazo do lote em minutos para --profile auto (0 = sem prazo)")
+    ap.add_argument(
+        "--escalate",
+        default="false",
+        help=f"true/false: segunda passada com {ESCALATE_MODEL} nos segmentos de baixa confiança (perfis/modelos menores)",
+    )
     ap.add_argument("--vad_filter", default="true")
 
     ap.add_argument("--dict_path", default="assets/dicionario_televendas.txt")
     ap.add_argument("--roles_vendor_path", default="assets/roles_vendor_patterns.txt")
     ap.add_argument("--roles_client_path", default="assets/roles_client_patterns.txt")
 
-    ap.add_argument("--force", action="store_true", help="Ignora cache e reprocessa o áudio")
+    ap.add_argument("--force", action="store_true", help="Ignora o cache (final e por etapa) e reprocessa o áudio")
+    ap.add_argument(
+        "--reprocess_from_cache", "--reprocess-from-cache",
+        action="store_true",
+        help="Refaz só as etapas de texto de todo o histórico do cache.db (ASR/diarização do stage_cache) e reescreve TXT/JSON",
+    )
+    ap.add_argument(
+        "--json_format",
+        default="json",
+        choices=JSON_FORMATS,
+        help="json (objeto indentado) | jsonl (um segmento por linha) | columnar (uma coluna por linha)",
+    )
+    ap.add_argument(
+        "--run_summary",
+        default=None,
+        help="JSON com tempos por etapa, RTF, pico de RSS e threads da execução (default: <pai de --json_dir>/run_summary.json; vazio = desligado)",
+    )
+    ap.add_argument(
+        "--partial_dir",
+        default="",
+        help="Pasta para TXT parcial (<nome>.partial.txt) regravado durante o ASR; vazio = desligado",
+    )
+    ap.add_argument("--skip_unchanged", default="true", help="true/false: em cache HIT não reescreve TXT/JSON idênticos aos existentes")
+    ap.add_argument(
+        "--order",
+        default="auto",
+        choices=("auto", "path", "longest"),
+        help="Ordem da fila: path (caminho) | longest (mais longos primeiro) | auto (longest com --workers > 1)",
+    )
+    ap.add_argument("--workers", type=int, default=1, help="Processos paralelos de transcrição (default: 1)")
+    ap.add_argument(
+        "--asr_chunk_workers",
+        type=int,
+        default=0,
+        help=f"Chunks transcritos em paralelo em áudios > {ASR_CHUNK_MAX_S / 60:.0f} min, cortados em silêncios (0 = desligado)",
+    )
+    ap.add_argument(
+        "--asr_batch_size",
+        type=int,
+        default=0,
+        help=f"Lote do BatchedInferencePipeline para arquivos <= {ASR_BATCH_MAX_FILE_S / 60:.0f} min, agrupados entre arquivos (0 = desligado; só com --workers 1)",
+    )
+    ap.add_argument("--pipeline", default="true", help="true/false: sobrepõe ASR, texto e diarização de arquivos consecutivos (workers=1)")
+    ap.add_argument("--pipeline_queue", type=int, default=2, help="Tamanho das filas entre etapas do pipeline (default: 2)")
+    ap.add_argument("--diar_parallel", default="true", help="true/false: roda a diarização em paralelo ao ASR do mesmo arquivo")
+    ap.add_argument("--punctuation", default="true", help="true/false: restauração de pontuação (deepmultilingualpunctuation)")
+    ap.add_argument("--punct_batch_size", type=int, default=PUNCT_BATCH_SIZE, help="Chunks por inferência na pontuação em lote")
     return ap
 
 
@@ -1292,6 +4486,15 @@ def build_argparser() -> argparse.ArgumentParser:
 # =============================================================================
 def main() -> int:
     t0 = time.time()
+    startup: List[Tuple[str, float]] = [("imports", time.perf_counter() - _T_IMPORT0)]
+    tick = time.perf_counter()
+
+    def _mark(label: str) -> None:
+        nonlocal tick
+        now = time.perf_counter()
+        startup.append((label, now - tick))
+        tick = now
+
     args = build_argparser().parse_args()
 
     input_dir = Path(args.input_dir)
@@ -1300,17 +4503,27 @@ def main() -> int:
 
     _ensure_dir(txt_dir)
     _ensure_dir(json_dir)
+    # fora da pasta de JSON: o 02 lê todos os *.json de lá
+    run_summary: Optional[Path] = (
+        None if args.run_summary == "" else Path(args.run_summary) if args.run_summary else json_dir.parent / "run_summary.json"
+    )
 
     cache_dir = (Path.cwd() / CACHE_DIR_NAME).resolve()
     _ensure_dir(cache_dir)
     cache_db_path = cache_dir / CACHE_DB_NAME
     db = CacheDB(cache_db_path)
+    _mark("cache_db")
 
     recursive = _parse_bool(args.recursive)
     vad_filter = _parse_bool(args.vad_filter)
-
-    audio_files = resolve_audio_files(input_dir, args.pattern, recursive, args.only_file)
-    if not audio_files:
+    workers = max(1, int(args.workers or 1))
+    reprocess = bool(args.reprocess_from_cache)
+    skip_unchanged = _parse_bool(args.skip_unchanged)
+
+    # no reprocessamento a fonte é o cache.db, não a pasta de entrada
+    audio_files = [] if reprocess else resolve_audio_files(input_dir, args.pattern, recursive, args.only_file)
+    _mark("descoberta")
+    if not audio_files and not reprocess:
         print(f"Nenhum áudio encontrado. input_dir={input_dir} pattern={args.pattern} recursive={recursive} only_file={args.only_file!r}")
         db.close()
         return 2
@@ -1320,16 +4533,19 @@ def main() -> int:
 
     dicionario = carregar_dicionario(args.dict_path)
     dict_enabled = bool(dicionario)
+    fuzzy_backend = _fuzzy_backend_name()
 
-    if dict_enabled and fuzz is None:
+    if dict_enabled and _dict_fuzzy_backend() == "desabilitado":
         print("Erro: fuzzywuzzy não está instalado, mas o dicionário existe.")
         print("Instale com: pip install fuzzywuzzy python-levenshtein")
         db.close()
         return 2
 
     role_patterns, role_pat_stats = load_role_patterns(args.roles_vendor_path, args.roles_client_path)
+    _mark("assets")
 
     resolved_device = _resolve_device(args.device)
+    _mark("device")
     compute_type = "int8" if resolved_device == "cpu" else "float16"
 
     asr_params = ASRParams(
@@ -1339,265 +4555,221 @@ def main() -> int:
         compute_type=compute_type,
         vad_filter=bool(vad_filter),
         beam_size=int(args.beam_size),
+        chunk_workers=max(0, int(args.asr_chunk_workers)),
+        batch_size=max(0, int(args.asr_batch_size)),
     )
+    profile = str(args.profile)
+    escalate = _parse_bool(args.escalate)
+    if profile in ASR_PROFILES:
+        asr_params = _profile_params(asr_params, profile, escalate)
+    elif profile == "auto":
+        # base = perfil mais preciso; cada arquivo recebe o seu em _plan_profiles
+        asr_params = _profile_params(asr_params, ASR_PROFILE_ORDER[0], escalate)
+    elif escalate and asr_params.model != ESCALATE_MODEL:
+        asr_params.escalate_model = ESCALATE_MODEL
+    punctuation = _parse_bool(args.punctuation)
     params_hash = _params_hash(asr_params)
+    # chaves candidatas: (perfil, caminho do ASR, hash). Com --profile auto o cache aceita o resultado
+    # de qualquer perfil, preferindo o mais preciso; com chunks/lote, o de qualquer caminho.
+    profile_hashes: List[Tuple[str, str, str]] = [
+        (name, route, _params_hash(p, route))
+        for name, p in (
+            [(n, _profile_params(asr_params, n, escalate)) for n in ASR_PROFILE_ORDER] if profile == "auto" else [("", asr_params)]
+        )
+        for route in _asr_routes(p)
+    ]
+
+    ctx = RunContext(
+        asr_params=asr_params,
+        hf_token=hf_token,
+        dicionario=dicionario,
+        role_patterns=role_patterns,
+        role_pat_stats=role_pat_stats,
+        dict_path=str(args.dict_path),
+        roles_vendor_path=str(args.roles_vendor_path),
+        roles_client_path=str(args.roles_client_path),
+        diar_parallel=_parse_bool(args.diar_parallel),
+        corretor=DictionaryCorrector(dicionario) if dict_enabled else None,
+        punctuation=punctuation,
+        punct_batch_size=max(1, int(args.punct_batch_size)),
+        cache_db_path=str(cache_db_path),
+        stage_cache=reprocess or not args.force,
+        json_format=str(args.json_format),
+        partial_dir=str(args.partial_dir or ""),
+        profile=profile,
+        post_hash=_post_hash(
+            str(args.dict_path),
+            str(args.roles_vendor_path),
+            str(args.roles_client_path),
+            punctuation,
+            _dict_fuzzy_backend() if dict_enabled else "",
+            punct_batch_size=max(1, int(args.punct_batch_size)),
+        ),
+    )
+    _mark("contexto")
 
     print("SPIN Analyzer — 01_transcricao")
     print(f"Entrada: {input_dir.resolve()}")
     print(f"Saídas:  TXT={txt_dir.resolve()} | JSON={json_dir.resolve()}")
     print(f"Cache:   {cache_db_path}")
-    print(f"ASR:     faster-whisper | model={asr_params.model} | device={asr_params.device} | compute_type={asr_params.compute_type} | lang={asr_params.language}")
+    print(
+        f"ASR:     faster-whisper | "
+        + (f"model={asr_params.model} | " if profile != "auto" else "")
+        + f"device={asr_params.device} | compute_type={asr_params.compute_type} | lang={asr_params.language} | perfil={profile}"
+        + (f" | 2ª passada={asr_params.escalate_model or ESCALATE_MODEL}" if asr_params.escalate_model or (profile == "auto" and escalate) else "")
+    )
+    if float(args.deadline) > 0 and profile != "auto":
+        print("Aviso: --deadline só tem efeito com --profile auto.")
     print(f"Diarização: {'habilitada' if hf_present else 'desabilitada'} (HF_TOKEN {'presente' if hf_present else 'ausente'})")
+    print(
+        f"Pontuação: "
+        + ("desabilitada (--punctuation false)" if not punctuation else
+           (f"sob demanda, lote de {ctx.punct_batch_size}" if _module_available("deepmultilingualpunctuation") else "indisponível (deepmultilingualpunctuation)"))
+    )
     print(
         f"Roles (fallback textual): vendor_re={role_pat_stats['vendor_re']} vendor_txt={role_pat_stats['vendor_txt']} | "
         f"client_re={role_pat_stats['client_re']} client_txt={role_pat_stats['client_txt']} | "
-        f"fuzzy={'rapidfuzz' if _rfuzz is not None else ('fuzzywuzzy' if fuzz is not None else 'desabilitado')}"
+        f"fuzzy={fuzzy_backend}"
+    )
+    if reprocess:
+        print("Modo:    reprocessamento a partir do cache (só etapas de texto)")
+    else:
+        print(f"Itens:   {len(audio_files)}")
+    print(
+        "Startup: "
+        + " | ".join(f"{label} {sec * 1000:.0f}ms" for label, sec in startup)
+        + f" | total {sum(sec for _, sec in startup) * 1000:.0f}ms (modelos carregados sob demanda)"
     )
-    print(f"Itens:   {len(audio_files)}")
     print("-" * 72)
 
-    for idx, audio_path in enumerate(audio_files, start=1):
-        item_t0 = time.time()
-        name = audio_path.name
-
-        out_txt = txt_dir / f"{audio_path.stem}.txt"
-        out_json = json_dir / f"{audio_path.stem}.json"
-
-        try:
-            audio_hash = _sha256_file(audio_path)
-        except Exception as e:
-            audio_hash = ""
-            print(f"[{idx}/{len(audio_files)}] {name} | Aviso: falha ao calcular hash. Motivo: {type(e).__name__}: {e}")
-
-        cache_key = _sha256_bytes(f"{audio_hash}{params_hash}".encode("utf-8")) if audio_hash else ""
-
-        if (not args.force) and cache_key:
-            cached = db.get(cache_key)
-            if cached:
-                try:
-                    _write_text(out_txt, cached["txt"])
-                    _write_json(out_json, cached["json"])
-                    try:
-                        _archive_audio(audio_path, cache_dir, audio_hash)
-                    except Exception:
-                        pass
-                    elapsed = time.time() - item_t0
-                    print(f"[{idx}/{len(audio_files)}] {name} | Cache: HIT | Tempo: {_format_elapsed(elapsed)} | TXT/JSON regenerados")
-                    continue
-                except Exception as e:
-                    print(f"[{idx}/{len(audio_files)}] {name} | Cache: HIT, mas falhou ao escrever saídas. Reprocessando. Motivo: {type(e).__name__}: {e}")
-
-        errors: List[Dict[str, str]] = []
-        duration_s = _try_get_wav_duration_seconds(audio_path)
-
-        print(f"[{idx}/{len(audio_files)}] {name} | Início | Device={asr_params.device} | Modelo={asr_params.model}")
-        tick0 = time.time()
-
-        asr_segments_raw = _run_asr_faster_whisper(audio_path, asr_params, errors)
-        print(f"[{idx}/{len(audio_files)}] {name} | ASR finalizado | Tempo parcial {_format_elapsed(time.time() - tick0)} | Segmentos {len(asr_segments_raw)}")
-
-        diarization_mode = "fallback_all_vendor"
-        segments_final: List[Dict[str, Any]] = []
-        total_corrigidas = 0
-        role_stats: Dict[str, Any] = {}
-        smooth_stats: Dict[str, Any] = {}
-        diar_quality: Dict[str, Any] = {}
-        merge_stats: Dict[str, Any] = {"merges": 0, "in": 0, "out": 0}
-        split_stats: Dict[str, Any] = {"changed": 0, "in": 0, "out": 0}
-
-        if not asr_segments_raw:
-            diarization_mode = "fallback_all_vendor"
-            segments_final = []
-        else:
-            asr_segments, merge_stats = _merge_asr_segments(asr_segments_raw)
-            print(f"[{idx}/{len(audio_files)}] {name} | Merge ASR: {merge_stats['merges']} junções | {merge_stats['in']} -> {merge_stats['out']} segmentos")
-
-            if _PUNCT_MODEL is not None:
-                for seg in asr_segments:
-                    try:
-                        seg["text"] = _PUNCT_MODEL.restore_punctuation(seg.get("text", ""))
-                    except Exception:
-                        pass
-
-            total_corrigidas = 0
-            if dict_enabled:
-                for seg in asr_segments:
-                    try:
-                        seg["text"], n_corr = aplicar_dicionario(seg.get("text", ""), dicionario)
-                        total_corrigidas += int(n_corr)
-                    except Exception:
-                        pass
-
-            asr_segments, split_stats = split_mixed_turns(asr_segments)
-            if split_stats.get("changed", 0) > 0:
-                print(f"[{idx}/{len(audio_files)}] {name} | Split turnos: {split_stats['changed']} segmentos quebrados | {split_stats['in']} -> {split_stats['out']} segmentos")
-            else:
-                print(f"[{idx}/{len(audio_files)}] {name} | Split turnos: 0 | {split_stats['in']} -> {split_stats['out']} segmentos")
-
-            if hf_present:
-                ann, diar_ok, reason = _run_diarization_pyannote(audio_path, hf_token, asr_params.device, errors)
-
-                assigned = None
-                if ann is not None:
-                    try:
-                        assigned = _assign_speakers_to_segments(asr_segments, ann)
-                    except Exception as e:
-                        errors.append({"stage": "diar_assign", "error": f"{type(e).__name__}: {e}"})
-                        assigned = None
-
-                diar_ok2 = False
-                if assigned is not None:
-                    diar_ok2, diar_quality = assess_diarization_quality(ann, assigned)
-                else:
-                    diar_quality = {"ok": False, "speakers": 0, "collapsed": None, "max_share": None, "coverage": None}
-
-                if diar_ok and diar_ok2 and assigned is not None:
-                    segments_final = assigned
-                    diarization_mode = "pyannote_ok"
-
-                    spk_n = diar_quality.get("speakers")
-                    max_share = diar_quality.get("max_share")
-                    coverage = diar_quality.get("coverage")
-                    ms = f"{float(max_share):.3f}" if isinstance(max_share, (int, float)) else "n/a"
-                    cv = f"{float(coverage):.3f}" if isinstance(coverage, (int, float)) else "n/a"
-                    print(f"[{idx}/{len(audio_files)}] {name} | Diarização acústica: aprovada | speakers={spk_n} | max_share={ms} | coverage={cv}")
-
-                else:
-                    spk_n = diar_quality.get("speakers")
-                    max_share = diar_quality.get("max_share")
-                    coverage = diar_quality.get("coverage")
-                    collapsed = diar_quality.get("collapsed")
-
-                    ms = f"{float(max_share):.3f}" if isinstance(max_share, (int, float)) else "n/a"
-                    cv = f"{float(coverage):.3f}" if isinstance(coverage, (int, float)) else "n/a"
-                    print(
-                        f"[{idx}/{len(audio_files)}] {name} | Diarização acústica: rejeitada | motivo={reason} | "
-                        f"speakers={spk_n} | collapsed={collapsed} | max_share={ms} | coverage={cv}"
-                    )
-
-                    errors.append({"stage": "diar_quality", "error": f"diarization_not_reliable: {reason} | assessed_ok={diar_ok2} | stats={diar_quality}"})
-
-                    segments_rb, role_stats = role_by_text(asr_segments, role_patterns)
-                    segments_rb, smooth_stats = smooth_roles(segments_rb)
-                    segments_final = segments_rb
-                    diarization_mode = "pyannote_failed_role_by_text"
-
-                    print(
-                        f"[{idx}/{len(audio_files)}] {name} | Fallback textual: aplicado | "
-                        f"vendedor={role_stats.get('vendor_pct')}% cliente={role_stats.get('client_pct')}% | "
-                        f"conf_média={role_stats.get('mean_conf')}"
-                    )
-                    if smooth_stats.get("changed", 0) > 0:
-                        print(
-                            f"[{idx}/{len(audio_files)}] {name} | Smoothing: {smooth_stats.get('changed')} correções | "
-                            f"ilhas={smooth_stats.get('islands_fixed')} | pós-pergunta={smooth_stats.get('postq_fixed')}"
-                        )
-
-            else:
-                segments_rb, role_stats = role_by_text(asr_segments, role_patterns)
-                segments_rb, smooth_stats = smooth_roles(segments_rb)
-                segments_final = segments_rb
-                diarization_mode = "no_token_role_by_text"
-
-                print(
-                    f"[{idx}/{len(audio_files)}] {name} | Diarização acústica: indisponível | "
-                    f"Fallback textual: aplicado | vendedor={role_stats.get('vendor_pct')}% cliente={role_stats.get('client_pct')}% | "
-                    f"conf_média={role_stats.get('mean_conf')}"
+    if reprocess:
+        ctx.workers = workers
+        with db.batched():
+            stats: Dict[str, int] = {}
+            for name, route, p_hash in profile_hashes:
+                part = _run_reprocess(
+                    ctx, db, workers, bool(args.force), cache_dir, txt_dir, json_dir, p_hash,
+                    params=_profile_params(asr_params, name, escalate) if name else None, profile=name, route=route,
                 )
-                if smooth_stats.get("changed", 0) > 0:
-                    print(
-                        f"[{idx}/{len(audio_files)}] {name} | Smoothing: {smooth_stats.get('changed')} correções | "
-                        f"ilhas={smooth_stats.get('islands_fixed')} | pós-pergunta={smooth_stats.get('postq_fixed')}"
-                    )
-
-            if not segments_final:
-                diarization_mode = "fallback_all_vendor"
-                segments_final = asr_segments
-                print(f"[{idx}/{len(audio_files)}] {name} | Aviso: role_by_text não produziu segmentos. Mantendo fallback total vendedor.")
-
-        print(f"[{idx}/{len(audio_files)}] {name} | Correções lexicais (dicionário): {total_corrigidas}")
-
-        meta: Dict[str, Any] = {
-            "file": str(audio_path.resolve()),
-            "file_name": audio_path.name,
-            "duration_seconds": duration_s,
-            "asr": {
-                "engine": "faster-whisper",
-                "model": asr_params.model,
-                "language": asr_params.language,
-                "device": asr_params.device,
-                "compute_type": asr_params.compute_type,
-                "vad_filter": asr_params.vad_filter,
-                "beam_size": asr_params.beam_size,
-            },
-            "merge": merge_stats,
-            "split_turnos": split_stats,
-            "diarization": diarization_mode,
-            "created_at": _now_iso(),
-            "quality": {
-                "role_by_text": role_stats,
-                "smoothing": smooth_stats,
-                "pyannote_assessment": diar_quality,
-            },
-            "assets": {
-                "dict_path": str(Path(args.dict_path)),
-                "roles_vendor_path": str(Path(args.roles_vendor_path)),
-                "roles_client_path": str(Path(args.roles_client_path)),
-                "roles_loaded": role_pat_stats,
-            },
-        }
-
-        json_obj: Dict[str, Any] = {
-            "metadata": meta,
-            "diarization": diarization_mode,
-            "errors": errors,
-            "segments": segments_final,
-        }
+                stats = {k: stats.get(k, 0) + v for k, v in part.items()}
+        print("-" * 72)
+        print(
+            f"Reprocessamento concluído. Entradas: {stats['total']} | reprocessadas={stats['reprocessados']} | "
+            f"já atuais={stats['atuais']} | sem ASR em cache={stats['sem_asr']} | falhas={stats['falhas']} | "
+            f"Tempo total: {_format_elapsed(time.time() - t0)}"
+        )
+        if run_summary is not None:
+            _write_run_summary(run_summary, ctx, "reprocessamento", t0, {"items": stats["total"]})
+        _close_stage_db()
+        db.close()
+        return 0
 
-        txt_content = _build_txt(segments_final, diarization_mode)
+    def _keys(job: FileJob) -> List[Tuple[str, str, str]]:
+        if not job.audio_hash:
+            return []
+        return [(name, route, _sha256_bytes(f"{job.audio_hash}{p_hash}".encode("utf-8"))) for name, route, p_hash in profile_hashes]
 
-        try:
-            _write_text(out_txt, txt_content)
-        except Exception as e:
-            print(f"[{idx}/{len(audio_files)}] {name} | Erro ao salvar TXT: {type(e).__name__}: {e}")
+    pending: List[FileJob] = []
+    n_indexed = 0
+    for start in range(0, len(audio_files), CACHE_LOOKUP_CHUNK):
+        chunk: List[FileJob] = []
+        for idx, audio_path in enumerate(audio_files[start:start + CACHE_LOOKUP_CHUNK], start=start + 1):
+            job = FileJob(idx=idx, total=len(audio_files), audio_path=audio_path, t0=time.time())
 
-        try:
-            _write_json(out_json, json_obj)
-        except Exception as e:
-            print(f"[{idx}/{len(audio_files)}] {name} | Erro ao salvar JSON: {type(e).__name__}: {e}")
-
-        archived_path = None
-        if audio_hash:
             try:
-                archived = _archive_audio(audio_path, cache_dir, audio_hash)
-                archived_path = str(archived) if archived else None
-            except Exception:
-                archived_path = None
+                with job.timed("hash"):
+                    job.audio_hash, from_index = _fingerprint_sha256(db, audio_path)
+                n_indexed += int(from_index)
+            except Exception as e:
+                job.audio_hash = ""
+                job.log(f"Aviso: falha ao calcular hash. Motivo: {type(e).__name__}: {e}")
 
-        if cache_key:
+            job.cache_key = _sha256_bytes(f"{job.audio_hash}{params_hash}".encode("utf-8")) if job.audio_hash else ""
+            chunk.append(job)
+
+        # uma consulta por bloco em vez de um SELECT por arquivo
+        cached_rows: Dict[str, Dict[str, Any]] = {}
+        if not args.force:
             try:
-                meta_cache = dict(meta)
-                meta_cache["archived_path"] = archived_path
-                db.upsert(
-                    cache_key=cache_key,
-                    audio_hash=audio_hash,
-                    params_hash=params_hash,
-                    orig_name=audio_path.stem,
-                    orig_ext=audio_path.suffix.lower(),
-                    archived_path=archived_path,
-                    meta=meta_cache,
-                    txt_content=txt_content,
-                    json_obj=json_obj,
-                )
+                cached_rows = db.get_many([key for job in chunk for _name, _route, key in _keys(job)])
             except Exception as e:
-                print(f"[{idx}/{len(audio_files)}] {name} | Aviso: falha ao salvar cache. Motivo: {type(e).__name__}: {e}")
-
-        elapsed = time.time() - item_t0
-        print(f"[{idx}/{len(audio_files)}] {name} | Método: {diarization_mode} | Erros: {len(errors)} | Tempo: {_format_elapsed(elapsed)} | Saídas: OK")
+                print(f"Aviso: falha ao consultar o cache. Motivo: {type(e).__name__}: {e}")
+
+        with db.batched():
+            for job in chunk:
+                cached, cached_profile, cached_route = None, "", ""
+                for name, route, key in _keys(job):
+                    if key in cached_rows:
+                        cached, cached_profile, cached_route = cached_rows[key], name, route
+                        break
+                if cached and not _post_current(cached, ctx.post_hash):
+                    # dicionário/padrões/constantes mudaram: ASR e diarização saem do stage_cache
+                    # (com --profile auto, no mesmo perfil do resultado em cache)
+                    job.profile, job.asr_route = cached_profile, cached_route
+                    job.log("Cache: pós-processamento desatualizado | refazendo só as etapas de texto")
+                elif cached and _serve_from_cache(
+                    job, cached, cache_dir, txt_dir, json_dir, db=db if skip_unchanged else None, json_format=ctx.json_format
+                ):
+                    continue
+                pending.append(job)
+
+    if n_indexed:
+        print(f"Hash: {n_indexed}/{len(audio_files)} arquivos sem releitura (índice de stat inalterado)")
+
+    n_workers = min(workers, len(pending))
+    if len(pending) > 1:
+        _estimate_durations(pending)
+        order = args.order if args.order != "auto" else ("longest" if n_workers > 1 else "path")
+        pending = _order_jobs(pending, order)
+        total_min = sum(float(j.est_duration_s or 0.0) for j in pending) / 60.0
+        print(f"Fila: {len(pending)} arquivos | ~{total_min:.1f} min de áudio | ordem={order}")
+
+    if n_workers <= 1 and pending:
+        _print_chunk_threads(asr_params)
+    if n_workers > 1:
+        # divide os núcleos entre os workers para não sobrecarregar a CPU
+        asr_params.cpu_threads = _split_cpu_threads(n_workers)
+        ctx.workers = n_workers
+        print(f"Workers: {n_workers} processos | cpu_threads por worker={asr_params.cpu_threads} | arquivos a processar={len(pending)}")
+        if asr_params.device == "cuda":
+            print("Aviso: com device=cuda cada worker carrega o próprio modelo na mesma GPU.")
+        _print_chunk_threads(asr_params)
+    if profile == "auto" and pending:
+        # prazo restante (mínimo 1 s: prazo estourado = o mais rápido possível)
+        remaining_s = max(1.0, float(args.deadline) * 60.0 - (time.time() - t0)) if float(args.deadline) > 0 else 0.0
+        _plan_profiles(ctx, pending, remaining_s, n_workers, escalate)
+    if n_workers > 1:
+        _run_pool(ctx, pending, n_workers, db, cache_dir, txt_dir, json_dir)
+    elif _parse_bool(args.pipeline) and len(pending) > 1:
+        progress = _BatchProgress(pending)
+
+        def _on_done(job: FileJob) -> None:
+            _finalize_job(ctx, job, db, cache_dir, txt_dir, json_dir)
+            progress.update(job)
+
+        _run_pipelined(ctx, pending, _on_done, queue_size=int(args.pipeline_queue))
+    else:
+        progress = _BatchProgress(pending)
+        for group in _asr_groups(ctx, pending):
+            for job in group:
+                job.t0 = time.time()
+            _stage_asr_group(ctx, group)
+            for job in group:
+                for stage in _FILE_STAGES[1:]:
+                    stage(ctx, job)
+                _finalize_job(ctx, job, db, cache_dir, txt_dir, json_dir)
+                if len(pending) > 1:
+                    progress.update(job)
+
+    _release_whisper_models()
+    _release_pyannote_pipelines()
+    _close_stage_db()
 
     total_elapsed = time.time() - t0
     print("-" * 72)
     print(f"Concluído. Itens: {len(audio_files)} | Tempo total: {_format_elapsed(total_elapsed)}")
+    if run_summary is not None:
+        _write_run_summary(run_summary, ctx, "transcricao", t0, {"items": len(audio_files), "cache_hits": len(audio_files) - len(pending)})
     db.close()
     return 0
 
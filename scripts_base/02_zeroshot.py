@@ -7,6 +7,7 @@ TXT -> Ollama -> TSV (tolerante) -> Excel individual.
 
 Arquivos:
 - Entrada (default): arquivos_transcritos/txt (recursivo por padrão)
+  - também aceita .jsonl / .columns.jsonl do 01 (--json_format jsonl|columnar), lidos em streaming
 - Saída (default): saida_excel
 - Prompts (sempre lidos do arquivo):
   - assets/Command_Core_D_Check_V2_6.txt
@@ -174,6 +175,54 @@ def sha256_text(s: str) -> str:
 def read_text_file(path: Path) -> str:
     return path.read_text(encoding="utf-8", errors="ignore")
 
+def transcript_stem(path: Path) -> str:
+    name = path.name
+    for suffix in (".columns.jsonl", ".jsonl"):
+        if name.lower().endswith(suffix):
+            return name[: -len(suffix)]
+    return path.stem
+
+def read_transcript(path: Path) -> str:
+    """
+    TXT lido direto. JSON Lines do 01 (jsonl: um segmento por linha; columnar: uma coluna por
+    linha) vira o mesmo texto "[PAPEL] fala" do TXT, lido em streaming: só as colunas role/text
+    são decodificadas e a leitura para ao atingir SPIN_MAX_LINES_TOTAL / SPIN_MAX_CHARS_TOTAL.
+    """
+    if not path.name.lower().endswith(".jsonl"):
+        return read_text_file(path)
+
+    lines: List[str] = []
+    chars = 0
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        header = json.loads(f.readline() or "{}")
+
+        if header.get("format") == "columnar":
+            cols: Dict[str, list] = {}
+            for raw in f:
+                if raw.startswith('{"column":"') and not raw.startswith(('{"column":"role"', '{"column":"text"')):
+                    continue
+                obj = json.loads(raw)
+                if obj.get("column") in ("role", "text"):
+                    cols[obj["column"]] = obj.get("values") or []
+                if len(cols) == 2:
+                    break
+            pairs = zip(cols.get("role", []), cols.get("text", []))
+        else:
+            pairs = ((seg.get("role"), seg.get("text")) for seg in (json.loads(raw) for raw in f if raw.strip()))
+
+        for role, text in pairs:
+            text = (text or "").strip()
+            if not text:
+                continue
+            lines.append(f"[{'CLIENTE' if role == 'CLIENTE' else 'VENDEDOR'}] {text}")
+            chars += len(lines[-1]) + 1
+            if (SPIN_MAX_LINES_TOTAL > 0 and len(lines) >= SPIN_MAX_LINES_TOTAL) or (
+                SPIN_MAX_CHARS_TOTAL > 0 and chars > SPIN_MAX_CHARS_TOTAL
+            ):
+                break
+
+    return "\n".join(lines) + ("\n" if lines else "")
+
 def now_iso() -> str:
     return datetime.now().isoformat(timespec="seconds")
 
@@ -663,12 +712,12 @@ def process_one(
     quiet: bool,
     logger: logging.Logger,
 ) -> JobResult:
-    stem = in_path.stem
+    stem = transcript_stem(in_path)
     out_xlsx = out_dir / f"{stem}_SPIN.xlsx"
 
-    # Lê TXT
+    # Lê TXT (ou JSON Lines do 01)
     try:
-        raw_txt = read_text_file(in_path)
+        raw_txt = read_transcript(in_path)
     except Exception as e:
         logger.error(f"Falha ao ler TXT: {in_path} | {e}")
         rows_fail = {ph: {"check1": "0", "check2": "0"} for ph in PHASES}
@@ -773,7 +822,7 @@ def parse_args() -> argparse.Namespace:
     )
     p.add_argument("--in_dir", default=str(DEFAULT_IN_DIR), help="Pasta de entrada (default: arquivos_transcritos/txt)")
     p.add_argument("--out_dir", default=str(DEFAULT_OUT_DIR), help="Pasta de saída (default: saida_excel)")
-    p.add_argument("--pattern", default="*.txt", help="Padrão de arquivos (default: *.txt)")
+    p.add_argument("--pattern", default="*.txt", help="Padrão de arquivos (default: *.txt; *.jsonl para as saídas compactas do 01)")
     p.add_argument("--recursive", default="true", help="true/false (default: true)")
     p.add_argument("--workers", type=int, default=1, help="Número de workers (default: 1)")
     p.add_argument("--force", action="store_true", help="Ignora cache e reprocessa")